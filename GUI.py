@@ -1,7 +1,9 @@
 "GUI For Pygame Games"
 
 import pygame as pg
+from os.path import commonprefix
 from assets import *
+from functions import get_font, textCache, GlyphAtlas
 
 mouseButtonMap = {"left": 1, "middle": 2, "right": 3}
 
@@ -80,17 +82,18 @@ class Button:
 
 
 class Text:
-    def __init__(self, text, x, y, color, size, font,  center=False, centerx=False, centery=False) -> None:
+    def __init__(self, text, x, y, color, size, font,  center=False, centerx=False, centery=False, cache=False) -> None:
+        "cache -> share rendered surfaces of identical text through functions.textCache"
 
         # saving reconstruction data
         self.text = str(text)
         self.color = color
         self.size = size
         self.font = font
+        self.cache = cache
 
         # creating text surface
-        font_style = pg.font.Font(fontLocation + self.font + ".ttf", self.size)
-        text_surface = font_style.render(self.text, True, self.color)
+        text_surface = self.render()
         if center:
             x -= text_surface.get_width() // 2
             y -= text_surface.get_height() // 2
@@ -106,9 +109,14 @@ class Text:
         self.type = "Text"
 
     
+    def render(self) -> pg.Surface:
+        font_style = get_font(fontLocation + self.font + ".ttf", self.size)
+        if self.cache:
+            return textCache.render(font_style, self.text, self.color)
+        return font_style.render(self.text, True, self.color)
+
     def reload(self, reloadRect=True):
-        font_style = pg.font.Font(fontLocation + self.font + ".ttf", self.size)
-        text_surface = font_style.render(self.text, True, self.color)
+        text_surface = Text.render(self)
 
         self.image = text_surface
 
@@ -118,8 +126,47 @@ class Text:
     def display(self, window):
         window.blit(self.image, self.rect)
 
+class GlyphText(Text):
+    """Text drawn from a shared GlyphAtlas, changing it costs one blit per
+    character instead of rasterizing the whole string. Best for counters."""
+
+    atlases: dict[tuple, GlyphAtlas] = {}
+    renderedText = None
+
+    def render(self) -> pg.Surface:
+        key = (self.font, self.size, tuple(self.color))
+        atlas = GlyphText.atlases.get(key)
+        if atlas is None:
+            font_style = get_font(fontLocation + self.font + ".ttf", self.size)
+            atlas = GlyphText.atlases[key] = GlyphAtlas(font_style, self.color)
+        text_surface = self.patch(atlas)
+        if text_surface is None:
+            text_surface = pg.Surface(atlas.size(self.text), pg.SRCALPHA)
+            # glyphs never overlap so copying them keeps their exact alpha
+            atlas.draw(text_surface, self.text, (0, 0), pg.BLEND_RGBA_MAX)
+        self.renderedText = self.text
+        return text_surface
+
+    def patch(self, atlas: GlyphAtlas) -> pg.Surface | None:
+        "Copies the last image and redraws only the changed end of the text, None when the size changed"
+        old, new = self.renderedText, self.text
+        if old is None or self.image.get_size() != atlas.size(new):
+            return None
+        unchanged = len(commonprefix((old, new)))
+        x = atlas.size(new[:unchanged])[0]
+        text_surface = self.image.copy()
+        atlas.erase(text_surface, pg.Rect(x, 0, text_surface.get_width() - x, text_surface.get_height()))
+        atlas.draw(text_surface, new[unchanged:], (x, 0), pg.BLEND_RGBA_MAX)
+        return text_surface
+
+    def reload(self, reloadRect=True):
+        self.image = self.render()
+        if reloadRect:
+            self.rect = self.image.get_rect(topleft=self.rect.topleft)
+
+
 class TextBox():
-    def __init__(self,  imageName, selectedImageName, border: tuple[int, int] | int, x, y, color, size, font, text="", center=False) -> None:
+    def __init__(self,  imageName, selectedImageName, border: tuple[int, int] | int, x, y, color, size, font, text="", center=False, cache=False) -> None:
         
         # saving reconstruction data
         super().__init__()
@@ -127,6 +174,7 @@ class TextBox():
         self.color = color
         self.size = size
         self.font = font
+        self.cache = cache
 
 
         self.boxImage = imageName
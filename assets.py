@@ -1,7 +1,14 @@
 import pygame as pg
-from functions import load_assets
+from functions import AssetCache, LazyAssets
 
-assets = {}
-assets.update(load_assets("assets"))
+assetMasks = {}
+assetCache = AssetCache(".asset_cache")
+# names warmed together by assets.prefetch
+assetGroups = {
+    "player": ["Player"],
+    "enemies": ["Mog2129"],
+    "world": ["Crate", "Rock", "Hole"],
+}
+assets = LazyAssets("assets", cache=assetCache, masks=assetMasks, groups=assetGroups)
 blockSize = 64
-fontLocation = "assets/fonts/"
\ No newline at end of file
+fontLocation = "assets/fonts/"
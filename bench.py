@@ -0,0 +1,348 @@
+"""Headless Benchmarks For The Outdoors Simulation
+
+python bench.py [--ticks N] [--scenario NAME] [--no-render] [--atlas] [--output results.json] [--baseline old.json]
+python bench.py --level-objects 100000
+python bench.py --memory-objects 50000
+python bench.py --check
+
+Runs Outdoors with the dummy video driver, an uncapped clock and scripted
+input, then reports ticks per second, time per phase and collision counts.
+--no-render skips display for pure simulation throughput.
+Pass a previous --output file as --baseline to flag regressions."""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import random
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from time import perf_counter
+
+import pygame as pg
+
+from assets import blockSize
+from collision import Enemy, Object, Player, collisionStats, transformCache
+from level import LevelReader, load_level_json, save_level, save_level_json
+from main import Outdoors, ScriptedKeys
+from profiler import FrameProfiler
+from rendering import Renderer, SpriteAtlas
+
+
+# -----------Scripted Input----------- #
+
+
+class ScriptedOutdoors(Outdoors):
+    """Outdoors driven by script(tick) -> (pressed keys, mouse position)
+    instead of the keyboard and mouse"""
+
+    def __init__(self, script, *args, **kwargs) -> None:
+        self.inputScript = script
+        self.keys, self.mousePos = ScriptedKeys(), (0, 0)
+        super().__init__(*args, **kwargs)
+        self.capFrameRate = False
+        self.tickCount = 0
+
+    def getPressed(self) -> ScriptedKeys:
+        return self.keys
+
+    def getMousePos(self) -> tuple[int, int]:
+        return self.mousePos
+
+    def step(self) -> None:
+        pressed, self.mousePos = self.inputScript(self.tickCount)
+        self.keys = ScriptedKeys(pressed)
+        self.tickCount += 1
+        super().step()
+
+
+def walkSquare(tick: int):
+    "Walks the player around a square, one side per second"
+    side = (tick // 60) % 4
+    return [(pg.K_d,), (pg.K_s,), (pg.K_a,), (pg.K_w,)][side], (0, 0)
+
+
+def circleMouse(tick: int):
+    "Thrusts forward while the mouse circles the middle of the window"
+    angle = tick * 0.05
+    return (pg.K_w,), (450 + int(math.cos(angle) * 200), 250 + int(math.sin(angle) * 200))
+
+
+# -----------Scenarios----------- #
+
+
+def enemiesVsCrates(game: Outdoors, rng: random.Random, enemies: int = 100, crates: int = 100) -> None:
+    for _ in range(crates):
+        x, y = rng.randrange(0, game.width, blockSize), rng.randrange(0, game.height, blockSize)
+        game.spawn(Object(x, y, "Crate", scale=2, data={"Health": 2000}))
+    for _ in range(enemies):
+        x, y = rng.randrange(0, game.width), rng.randrange(0, game.height)
+        game.spawn(Enemy(x, y, "Mog2129", scale=1.5, speed=3, data={"Health": 2000}))
+
+
+def crateGrid(game: Outdoors, rng: random.Random) -> None:
+    "Every other cell of the window filled with crates"
+    for x in range(0, game.width, blockSize):
+        for y in range(0, game.height, blockSize):
+            if (x // blockSize + y // blockSize) % 2:
+                game.spawn(Object(x, y, "Crate", scale=2, data={"Health": 2000}))
+    enemiesVsCrates(game, rng, enemies=20, crates=0)
+
+
+def tileGrid(game: Outdoors, rng: random.Random) -> None:
+    "crateGrid with the crates in the tile layer"
+    for x in range(0, game.width, blockSize):
+        for y in range(0, game.height, blockSize):
+            if (x // blockSize + y // blockSize) % 2:
+                game.placeTile(x, y, game.crate, 2000)
+    enemiesVsCrates(game, rng, enemies=20, crates=0)
+
+
+def crowd(game: Outdoors, rng: random.Random, count: int = 3000) -> None:
+    "Thousands of small sprites on screen, for draw cost per object"
+    for _ in range(count):
+        x, y = rng.randrange(0, game.width), rng.randrange(0, game.height)
+        game.spawn(Object(x, y, rng.choice(("Rock", "Hole", "Crate")), data={"Health": 2000}))
+    enemiesVsCrates(game, rng, enemies=20, crates=0)
+
+
+def rotatingPlayer(game: Outdoors, rng: random.Random) -> None:
+    game.player = Player(400, 200, "Player", pg.Rect(4, 4, 24, 24), scale=3, rotationStep=2)
+    game.player.data = {"Health": 10000}
+    enemiesVsCrates(game, rng, enemies=10, crates=30)
+
+
+scenarios = {
+    "enemiesVsCrates": (enemiesVsCrates, walkSquare),
+    "crateGrid": (crateGrid, walkSquare),
+    "tileGrid": (tileGrid, walkSquare),
+    "crowd": (crowd, walkSquare),
+    "rotatingPlayer": (rotatingPlayer, circleMouse),
+}
+
+
+def run(name: str, ticks: int = 600, warmup: int = 60, seed: int = 0, render: bool = True, atlas: bool = False) -> dict:
+    setup, script = scenarios[name]
+    random.seed(seed)
+    transformCache.clear()
+    game = ScriptedOutdoors(script, (900, 500), name, fps=60, spriteAtlas=atlas)
+    setup(game, random.Random(seed))
+    # keep every measured frame so the profiler's phases cover the same ticks
+    game.profiler = FrameProfiler(history=ticks)
+
+    phases = {"events": 0.0, "tick": 0.0, "display": 0.0}
+    for index in range(warmup + ticks):
+        if index == warmup:
+            phases = dict.fromkeys(phases, 0.0)
+            collisionStats.reset()
+            game.profiler.reset()
+        game.profiler.beginFrame()
+        start = perf_counter()
+        for event in pg.event.get():
+            game.event(event)
+        afterEvents = perf_counter()
+        game.tick()
+        afterTick = perf_counter()
+        if render:
+            if not game.renderer.dirty:
+                game.window.fill(game.background)
+            game.display()
+        end = perf_counter()
+        game.profiler.endFrame()
+        phases["events"] += afterEvents - start
+        phases["tick"] += afterTick - afterEvents
+        phases["display"] += end - afterTick
+
+    total = sum(phases.values())
+    counts = collisionStats.snapshot()
+    # finer phases inside tick recorded by the game's profiler
+    tickPhases = {name: ms for name, ms in game.profiler.averages().items() if name in ("path", "script", "collide", "spawn")}
+    return {
+        "ticks": ticks,
+        "ticksPerSecond": ticks / total if total else 0.0,
+        "phaseMs": {phase: seconds * 1000 / ticks for phase, seconds in phases.items()} | tickPhases,
+        "maskTestsPerTick": counts["maskTests"] / ticks,
+        "collideCallsPerTick": counts["collideCalls"] / ticks,
+        "skippedCallsPerTick": counts["skippedCalls"] / ticks,
+        "skippedPairsPerTick": {layer: count / ticks for layer, count in counts["skippedPairs"].items()},
+        "objects": len(game.objects),
+    }
+
+
+def levelBench(count: int) -> dict:
+    "Seconds to save and load count objects with the binary level format and the JSON one"
+    Outdoors((900, 500), "level")
+    objects = [Object(index % 400 * blockSize, index // 400 * blockSize, "Crate", scale=2, data={"Health": 2000}) for index in range(count)]
+    times = {}
+    with tempfile.TemporaryDirectory() as folder:
+        binaryPath, jsonPath = os.path.join(folder, "level.olvl"), os.path.join(folder, "level.json")
+        start = perf_counter()
+        save_level(binaryPath, objects)
+        times["saveBinary"] = perf_counter() - start
+        start = perf_counter()
+        save_level_json(jsonPath, objects)
+        times["saveJson"] = perf_counter() - start
+        start = perf_counter()
+        LevelReader(binaryPath).readAll()
+        times["loadBinary"] = perf_counter() - start
+        start = perf_counter()
+        load_level_json(jsonPath)
+        times["loadJson"] = perf_counter() - start
+        times["binaryBytes"], times["jsonBytes"] = os.path.getsize(binaryPath), os.path.getsize(jsonPath)
+    return times
+
+
+def memoryBench(count: int) -> dict:
+    "Bytes per object and nanoseconds per attribute read for count crates and count enemies"
+    Outdoors((900, 500), "memory")
+    results = {}
+    for label, build in (
+        ("Object", lambda index: Object(index % 400 * blockSize, index // 400 * blockSize, "Crate", scale=2, data={"Health": 2000})),
+        ("Enemy", lambda index: Enemy(index % 400 * 8, index // 400 * 8, "Mog2129", scale=1.5, speed=3, data={"Health": 2000})),
+    ):
+        build(0)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [build(index) for index in range(count)]
+        bytesPerObject = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+
+        reads = {
+            "rect.x": lambda: [obj.rect.x for obj in objects],
+            "data['Health']": lambda: [obj.data["Health"] for obj in objects],
+        }
+        if hasattr(objects[0], "health"):
+            reads["health"] = lambda: [obj.health for obj in objects]
+        results[label] = {"bytesPerObject": bytesPerObject} | {
+            name: min(timeit.repeat(read, number=1, repeat=5)) / count * 1e9 for name, read in reads.items()
+        }
+    return results
+
+
+# -----------Checks----------- #
+
+
+def checkTurningPlayer() -> None:
+    "A player following the mouse without a rotation table must not fill transformCache"
+    game = ScriptedOutdoors(circleMouse, (900, 500), "check", headless=True)
+    game.player = Player(400, 200, "Player", pg.Rect(4, 4, 24, 24), scale=3)
+    game.player.data = {"Health": 10000}
+    before = len(transformCache)
+    game.simulate(3600)
+    assert len(transformCache) - before < 10, f"{len(transformCache) - before} entries added"
+
+
+def checkAtlasReset() -> None:
+    "Frames drawn through a SpriteAtlas while it fills and resets match frames drawn without one"
+    def sprite(colour):
+        surface = pg.Surface((16, 32), pg.SRCALPHA)
+        surface.fill(colour)
+        return surface
+
+    def frame(surfaces, atlas):
+        window = pg.Surface((64, 32), pg.SRCALPHA)
+        Renderer(window, (0, 0, 0), atlas=atlas).draw([(index, surface, pg.Rect(index * 16, 0, 16, 32)) for index, surface in enumerate(surfaces)])
+        return pg.image.tobytes(window, "RGBA")
+
+    atlas = SpriteAtlas((32, 32), 32)
+    red, freed = sprite((255, 0, 0, 255)), sprite((0, 0, 255, 255))
+    frame([red, freed], atlas)
+    del freed
+    # the atlas fills with freed space partway through this frame
+    for surfaces in ([red, sprite((0, 255, 0, 255)), sprite((255, 255, 0, 255))], [red, sprite((0, 255, 255, 255))]):
+        assert frame(surfaces, atlas) == frame(surfaces, None), "atlas frame differs"
+
+
+checks = [checkTurningPlayer, checkAtlasReset]
+
+
+def runChecks() -> int:
+    "Runs every check, returns the number that failed"
+    failed = 0
+    for check in checks:
+        transformCache.clear()
+        try:
+            check()
+        except AssertionError as error:
+            failed += 1
+            print(f"{check.__name__}: FAILED {error}")
+        else:
+            print(f"{check.__name__}: ok")
+    return failed
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    "Names of scenarios whose ticks per second fell more than tolerance below baseline"
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = result["ticksPerSecond"] / old["ticksPerSecond"]
+        print(f"{name}: {old['ticksPerSecond']:.1f} -> {result['ticksPerSecond']:.1f} ticks/s ({ratio:.2f}x)")
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(arguments=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios))
+    parser.add_argument("--no-render", dest="render", action="store_false", help="skip display, simulation only")
+    parser.add_argument("--atlas", action="store_true", help="draw small sprites from a sprite atlas")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed ticks per second drop, 0.1 = 10%%")
+    parser.add_argument("--level-objects", type=int, help="time saving and loading a level of this many objects instead")
+    parser.add_argument("--memory-objects", type=int, help="measure memory and attribute reads for this many objects instead")
+    parser.add_argument("--check", action="store_true", help="run the correctness checks instead")
+    options = parser.parse_args(arguments)
+
+    if options.check:
+        return 1 if runChecks() else 0
+
+    if options.memory_objects:
+        for label, result in memoryBench(options.memory_objects).items():
+            reads = ", ".join(f"{name} {ns:.0f}ns" for name, ns in result.items() if name != "bytesPerObject")
+            print(f"{label}: {result['bytesPerObject']:.0f} bytes / object, {reads}")
+        return 0
+
+    if options.level_objects:
+        times = levelBench(options.level_objects)
+        print(f"{options.level_objects} objects: binary save {times['saveBinary']:.2f}s load {times['loadBinary']:.2f}s "
+              f"{times['binaryBytes'] / 1e6:.1f}MB, json save {times['saveJson']:.2f}s load {times['loadJson']:.2f}s "
+              f"{times['jsonBytes'] / 1e6:.1f}MB")
+        return 0
+
+    results = {}
+    for name in options.scenario or scenarios:
+        results[name] = result = run(name, options.ticks, options.warmup, options.seed, options.render, options.atlas)
+        phases = ", ".join(f"{phase} {ms:.2f}ms" for phase, ms in result["phaseMs"].items())
+        skipped = ", ".join(f"{layer} {count:.0f}" for layer, count in result["skippedPairsPerTick"].items())
+        print(f"{name}: {result['ticksPerSecond']:.1f} ticks/s ({phases}), "
+              f"{result['maskTestsPerTick']:.0f} mask tests / tick, {result['objects']} objects, "
+              f"pairs skipped / tick ({skipped or 'none'})")
+
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump({"settings": vars(options), "results": results}, file, indent=2)
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, options.tolerance)
+        if regressions:
+            print("Regressed:", ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,14 +4,18 @@ from logging import fatal
 
 import  pygame as pg
 import math
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from operator import attrgetter
 
 
 # Expects all images to be in a single dictionary with string keys
 try:
-    from assets import assets
+    from assets import assets, assetMasks
 except ModuleNotFoundError and ImportError:
     print("[Graphics] Assets not found")
     assets = {}
+    assetMasks = {}
 
 # objectMap defined at bottom of file
 
@@ -21,18 +25,409 @@ def clamp(
     return min(maxValue, max(minValue, value))
 
 
+def sweptMask(mask: pg.mask.Mask, length: int, axis: int) -> pg.mask.Mask:
+    "Mask covering every position of mask moved 0 to length - 1 pixels along axis (0 = x, 1 = y)"
+    width, height = mask.get_size()
+    swept = pg.mask.Mask((width, height + length - 1) if axis else (width + length - 1, height))
+    swept.draw(mask, (0, 0))
+    covered = 1
+    # doubles the covered distance each draw
+    while covered < length:
+        shift = min(covered, length - covered)
+        swept.draw(swept.copy(), (0, shift) if axis else (shift, 0))
+        covered += shift
+    return swept
+
+
+sweepResponses: dict[type, str | None] = {}
+
+
+def sweepResponse(obj) -> str | None:
+    """'solid' for blocking objects, 'sensor' for objects that only report contact,
+    'static' for objects with their own response that never move,
+    None when obj has its own response and must be stepped (it may move when touched)"""
+    cls = type(obj)
+    if cls in sweepResponses:
+        return sweepResponses[cls]
+    response = cls.collisionResponse
+    if response is None:
+        if cls.resolveXCollision is Object.resolveXCollision and cls.resolveYCollision is Object.resolveYCollision:
+            response = "solid"
+        elif cls.resolveXCollision is CoreObject.resolveXCollision and cls.resolveYCollision is CoreObject.resolveYCollision:
+            response = "sensor"
+    sweepResponses[cls] = response
+    return response
+
+
+# -----------Collision Layers----------- #
+
+
+# a class's collisionLayer is the one layer it is on, its collisionMask the layers its collide() tests against
+playerLayer, enemyLayer, staticLayer, pushableLayer = 1, 2, 4, 8
+layerNames = {playerLayer: "Player", enemyLayer: "Enemy", staticLayer: "Static", pushableLayer: "Pushable"}
+
+
+class CollisionStats:
+    "Running counters for benchmarks and profiling, reset() between measurements"
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.maskTests = 0
+        self.collideCalls = 0
+        # collide() calls not made for static or sleeping objects
+        self.skippedCalls = 0
+        # candidates dropped by collisionMask before any mask test, by the candidate's layer
+        self.skippedPairs: dict[str, int] = {}
+
+    def snapshot(self) -> dict:
+        return {
+            "maskTests": self.maskTests,
+            "collideCalls": self.collideCalls,
+            "skippedCalls": self.skippedCalls,
+            "skippedPairs": dict(self.skippedPairs),
+        }
+
+
+collisionStats = CollisionStats()
+
+
+def collideMask(left, right) -> tuple[int, int] | None:
+    "pg.sprite.collide_mask for objects that always have a mask, counted in collisionStats"
+    collisionStats.maskTests += 1
+    return left.mask.overlap(right.mask, (right.rect.x - left.rect.x, right.rect.y - left.rect.y))
+
+
+def collisionBounds(obj) -> pg.Rect:
+    "Area a mask test against obj can hit, the mask is placed at rect.topleft and may be larger than the rect"
+    if obj.mask is None:
+        return obj.rect.copy()
+    return pg.Rect(obj.rect.topleft, obj.mask.get_size()).union(obj.rect)
+
+
+# -----------Contact Events----------- #
+
+
+contactBegin, contactPersist, contactEnd = 0, 1, 2
+
+
+class ContactEvents:
+    """Per tick (kind, object, other) contact events for every pair reported by collide().\n
+    A pair reported any number of times in a tick is one event: contactBegin the first tick it
+    touches, contactPersist every tick after, and contactEnd on the first tick it is not reported.\n
+    Events are written to buffers reused every tick, iterate after flush()."""
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.kinds: list[int] = [contactEnd] * capacity
+        self.objects: list = [None] * capacity
+        self.others: list = [None] * capacity
+        self.count = 0
+        # insertion ordered pairs reported this tick and last tick
+        self.current: dict[tuple, None] = {}
+        self.previous: dict[tuple, None] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        kinds, objects, others = self.kinds, self.objects, self.others
+        for index in range(self.count):
+            yield kinds[index], objects[index], others[index]
+
+    def report(self, obj, other) -> None:
+        self.current[obj, other] = None
+
+    def push(self, kind: int, obj, other) -> None:
+        index = self.count
+        if index == len(self.kinds):
+            self.kinds.extend([contactEnd] * index)
+            self.objects.extend([None] * index)
+            self.others.extend([None] * index)
+        self.kinds[index], self.objects[index], self.others[index] = kind, obj, other
+        self.count = index + 1
+
+    def flush(self) -> None:
+        "Turns the pairs reported since the last flush into events, call once per tick after every collide()"
+        previousCount = self.count
+        self.count = 0
+        current, previous = self.current, self.previous
+        for pair in current:
+            self.push(contactPersist if pair in previous else contactBegin, *pair)
+        for pair in previous:
+            if pair not in current:
+                self.push(contactEnd, *pair)
+        # let go of objects only referenced by last tick's events
+        for index in range(self.count, previousCount):
+            self.objects[index], self.others[index] = None, None
+        previous.clear()
+        self.current, self.previous = previous, current
+
+    def clear(self) -> None:
+        "Forgets every contact without ending them"
+        self.current.clear()
+        self.previous.clear()
+        for index in range(self.count):
+            self.objects[index], self.others[index] = None, None
+        self.count = 0
+
+
+# -----------Object Data----------- #
+
+
+class ObjectData(MutableMapping):
+    """obj.data as a dictionary, "Health" is the object's typed health attribute
+    and any other keys are kept in obj.extraData"""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj) -> None:
+        self.obj = obj
+
+    def __getitem__(self, key):
+        obj = self.obj
+        if key == "Health":
+            health = obj.health
+            if health is None:
+                raise KeyError(key)
+            return health
+        if obj.extraData is None:
+            raise KeyError(key)
+        return obj.extraData[key]
+
+    def __setitem__(self, key, value) -> None:
+        obj = self.obj
+        if key == "Health":
+            obj.health = value
+            return
+        if obj.extraData is None:
+            obj.extraData = {}
+        obj.extraData[key] = value
+
+    def __delitem__(self, key) -> None:
+        obj = self.obj
+        if key == "Health":
+            if obj.health is None:
+                raise KeyError(key)
+            obj.health = None
+            return
+        if obj.extraData is None:
+            raise KeyError(key)
+        del obj.extraData[key]
+
+    def __iter__(self):
+        if self.obj.health is not None:
+            yield "Health"
+        if self.obj.extraData is not None:
+            yield from self.obj.extraData
+
+    def __len__(self) -> int:
+        return (self.obj.health is not None) + len(self.obj.extraData or ())
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def copy(self) -> dict:
+        obj = self.obj
+        data = {} if obj.health is None else {"Health": obj.health}
+        if obj.extraData:
+            data.update(obj.extraData)
+        return data
+
+
+unset = object()
+slotCopiers: dict[type, tuple] = {}
+
+
+def copySlots(source, target) -> None:
+    "Copies every attribute of source onto target, slots are copied directly so properties are bypassed"
+    cls = type(source)
+    copier = slotCopiers.get(cls)
+    if copier is None:
+        # slots hidden by a property further down the class tree are never used
+        names = tuple(
+            name for klass in cls.__mro__ for name in klass.__dict__.get("__slots__", ())
+            if name != "__dict__" and getattr(cls, name, None) is klass.__dict__[name]
+        )
+        copier = slotCopiers[cls] = names, attrgetter(*names)
+    names, getter = copier
+    try:
+        values = getter(source)
+    except AttributeError:
+        # some slot was never set on source
+        values = [getattr(source, name, unset) for name in names]
+    for name, value in zip(names, values):
+        if value is not unset:
+            setattr(target, name, value)
+    # reading __dict__ creates it, so the target only gets one when there is something to copy
+    overrides = getattr(source, "__dict__", None)
+    if overrides:
+        target.__dict__.update(overrides)
+
+
+# -----------Shared Transform Cache----------- #
+
+
+def spriteSize(name: str) -> tuple[int, int]:
+    "Size of an asset, without waiting for it to decode when assets are loaded lazily"
+    if hasattr(assets, "size"):
+        return assets.size(name)
+    return assets[name].get_size()
+
+
+def surfaceBytes(surface: pg.Surface) -> int:
+    return surface.get_pitch() * surface.get_height()
+
+
+def maskBytes(mask: pg.mask.Mask) -> int:
+    width, height = mask.get_size()
+    return (width + 7) // 8 * height
+
+
+class TransformCache:
+    """Process wide LRU cache of transformed sprites and masks keyed on (name, size, scale, angle).\n
+    Entries are shared by every object using them so they must not be drawn on.\n
+    maxBytes -> estimated memory ceiling, least recently used entries are evicted past it\n
+    placeholders -> build from assets.peek() instead of waiting for sprites still loading,
+    such entries are not cached and their masks are empty until the object is reloaded"""
+
+    def __init__(self, maxBytes: int = 64 * 1024 * 1024) -> None:
+        self.maxBytes = maxBytes
+        self.enabled = True
+        self.placeholders = False
+        # set by sprite() while a build uses a placeholder
+        self.provisional = False
+        self.entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self.entryBytes: dict[tuple, int] = {}
+        self.bytes = 0
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: tuple, build, size) -> tuple:
+        """Returns the cached entry for key, otherwise calls build() and caches it\n
+        size -> function returning the estimated bytes of an entry"""
+        if not self.enabled:
+            return build()
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        self.provisional = False
+        entry = build()
+        entryBytes = size(entry)
+        if entryBytes > self.maxBytes or self.provisional:
+            return entry
+        self.entries[key] = entry
+        self.entryBytes[key] = entryBytes
+        self.bytes += entryBytes
+        while self.bytes > self.maxBytes:
+            oldKey, _ = self.entries.popitem(last=False)
+            self.bytes -= self.entryBytes.pop(oldKey)
+            self.evictions += 1
+        return entry
+
+    def sprite(self, name: str) -> pg.Surface:
+        "assets[name], or its placeholder while it is loading when placeholders are on"
+        if self.placeholders and not assets.isReady(name):
+            self.provisional = True
+            return assets.peek(name)
+        return assets[name]
+
+    def scaled(self, name: str, size, scale: int | float) -> tuple[pg.Surface, pg.Surface]:
+        "Returns (morphedImage, scaledImage)"
+        def build():
+            morphedImage = pg.transform.scale(self.sprite(name), size)
+            return morphedImage, pg.transform.scale_by(morphedImage, scale)
+
+        return self.get(
+            ("scaled", name, tuple(size), scale), build,
+            lambda entry: surfaceBytes(entry[0]) + surfaceBytes(entry[1]),
+        )
+
+    def rotated(self, name: str, size, scale: int | float, angle: int | float) -> tuple[pg.Surface, pg.mask.Mask]:
+        "Returns (rotatedImage, mask)"
+        def build():
+            rotatedImage = pg.transform.rotate(self.scaled(name, size, scale)[1], angle)
+            # untransformed sprites can reuse the mask loaded with the asset
+            if angle == 0 and scale == 1 and name in assetMasks and tuple(size) == spriteSize(name):
+                return rotatedImage, assetMasks[name]
+            return rotatedImage, pg.mask.from_surface(rotatedImage)
+
+        # angles such as ones following the mouse rarely repeat and would only evict shared entries
+        if angle % 1:
+            return build()
+        return self.get(
+            ("rotated", name, tuple(size), scale, angle), build,
+            lambda entry: surfaceBytes(entry[0]) + maskBytes(entry[1]),
+        )
+
+    def rotationTable(self, name: str, size, scale: int | float, step: int | float) -> list[tuple[pg.Surface, pg.mask.Mask]]:
+        "Returns (rotatedImage, mask) for every step degrees, index i holds angle i * 360 / len(table)"
+        def build():
+            scaledImage = self.scaled(name, size, scale)[1]
+            count = max(1, round(360 / step))
+            table = []
+            for index in range(count):
+                rotatedImage = pg.transform.rotate(scaledImage, index * 360 / count)
+                table.append((rotatedImage, pg.mask.from_surface(rotatedImage)))
+            return table
+
+        return self.get(
+            ("table", name, tuple(size), scale, step), build,
+            lambda entry: sum(surfaceBytes(image) + maskBytes(mask) for image, mask in entry),
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        "Call after assets change"
+        self.entries.clear()
+        self.entryBytes.clear()
+        self.bytes = 0
+
+
+transformCache = TransformCache()
+
+
 # -----------Base Class For All Classes -----------#
 
 
 class CoreObject:
+    # surfaces and masks are shared through transformCache, each object only holds references.
+    # __dict__ is only created once an object overrides a class setting such as rotationStep
+    __slots__ = (
+        "name", "rect", "mask", "scale", "angle", "size",
+        "morphedImage", "scaledImage", "rotatedImage", "rotationTable",
+        "handle", "pool", "health", "extraData", "dataView", "__dict__",
+    )
     type = "Object"
+    # degrees between pre-rotated images, rotate() snaps to the nearest one when set
+    rotationStep: int | float = None
+    # overrides sweepResponse's detection
+    collisionResponse: str = None
+    # objects never move into anything unless a subclass says which layers it tests
+    collisionLayer = staticLayer
+    collisionMask = 0
 
     def __init__(
         self, x: int, y: int, name: str, scale: int | float = 1, angle: int = 0, size: tuple[int, int] | list[int, int] = None, data=None
     ) -> None:
         self.name = name
-        self.rect: pg.Rect = assets[name].get_rect(topleft=(x, y))
-        self.mask = pg.mask.from_surface(assets[name])
+        self.rect: pg.Rect = pg.Rect((x, y), spriteSize(name))
+        self.mask = None
         self.scale = scale
         self.angle = angle
         if size is None:
@@ -40,22 +435,60 @@ class CoreObject:
         else:
             self.size = size
         self.size = [self.size[0], self.size[1]]
+        self.rotationTable: list[tuple[pg.Surface, pg.mask.Mask]] = None
+        # stable id given by entities.EntityRegistry
+        self.handle: int = None
+        # ObjectPool the object goes back to when despawned
+        self.pool: ObjectPool = None
+        # ObjectData returned by data, made on first use
+        self.dataView: ObjectData = None
         self.reload()
         self.data = data
 
+    @property
+    def data(self) -> ObjectData | None:
+        "health and extraData as one dictionary, None when the object has neither"
+        if self.health is None and self.extraData is None:
+            return None
+        view = self.dataView
+        if view is None:
+            view = self.dataView = ObjectData(self)
+        return view
+
+    @data.setter
+    def data(self, value) -> None:
+        if value is None:
+            self.health, self.extraData = None, None
+            return
+        extraData = dict(value)
+        self.health: int = extraData.pop("Health", None)
+        self.extraData: dict = extraData if extraData or "Health" not in value else None
+
+    def __getstate__(self):
+        # pools hold shared surfaces and masks, which cannot be pickled, whoever unpickles reattaches it
+        instanceDict, slots = super().__getstate__()
+        return instanceDict, {**slots, "pool": None}
+
     def resetSize(self) -> None:
-        self.size = [assets[self.name].get_width(), assets[self.name].get_height()]
+        self.size = list(spriteSize(self.name))
 
     def reload(self) -> None:
-        self.morphedImage = pg.transform.scale(assets[self.name], self.size)
-        self.scaledImage = pg.transform.scale_by(self.morphedImage, self.scale)
-        self.rotatedImage = pg.transform.rotate(self.scaledImage, self.angle)
-        self.mask = pg.mask.from_surface(self.rotatedImage)
+        self.morphedImage, self.scaledImage = transformCache.scaled(self.name, self.size, self.scale)
+        if self.rotationStep:
+            self.rotationTable = transformCache.rotationTable(self.name, self.size, self.scale, self.rotationStep)
+        else:
+            self.rotationTable = None
+        self.rotatedImage, self.mask = self.rotatedEntry()
         self.rect = self.rotatedImage.get_rect(center=self.rect.center)
 
+    def rotatedEntry(self) -> tuple[pg.Surface, pg.mask.Mask]:
+        if self.rotationTable is None:
+            return transformCache.rotated(self.name, self.size, self.scale, self.angle)
+        table = self.rotationTable
+        return table[round(self.angle * len(table) / 360) % len(table)]
+
     def rotate(self) -> None:
-        self.rotatedImage = pg.transform.rotate(self.scaledImage, self.angle)
-        self.mask = pg.mask.from_surface(self.rotatedImage)
+        self.rotatedImage, self.mask = self.rotatedEntry()
         self.rect = self.rotatedImage.get_rect(center=self.rect.center)
 
     def script(self, *args): ...
@@ -63,8 +496,25 @@ class CoreObject:
     def display(self, window: pg.Surface, x_offset: int = 0, y_offset: int = 0) -> None:
         window.blit(self.rotatedImage, (self.rect.x - x_offset, self.rect.y - y_offset))
 
+    def clone(self, x: int, y: int, data=None) -> "CoreObject":
+        "Copy with its rect's topleft at x, y sharing this object's surfaces and mask, much faster than constructing one"
+        return self.cloneInto(object.__new__(type(self)), x, y, data)
+
+    def cloneInto(self, obj: "CoreObject", x: int, y: int, data=None) -> "CoreObject":
+        "Resets obj, of the same class, to be a clone of this object"
+        copySlots(self, obj)
+        obj.rect = pg.Rect(x, y, self.rect.width, self.rect.height)
+        obj.size = list(self.size)
+        obj.handle = None
+        obj.pool = None
+        # the copied view would read this object's data
+        obj.dataView = None
+        obj.data = data
+        return obj
+
     def pack(self):
         self.morphedImage, self.scaledImage, self.rotatedImage, self.mask = None, None, None, None
+        self.rotationTable = None
 
     def unpack(self):
         self.reload()
@@ -72,27 +522,131 @@ class CoreObject:
     def collide(self, *args): return []
 
     def resolveXCollision(self, player, *args):
-        if pg.sprite.collide_mask(player, self): return True
+        if collideMask(player, self): return True
         return False
 
     def resolveYCollision(self, player, *args):
-        if pg.sprite.collide_mask(player, self): return True
+        if collideMask(player, self): return True
         return False
 
 
+# -----------Spatial Hash Broadphase----------- #
+
+
+class SpatialHash:
+    """Uniform grid index, each cell holds the objects whose collision bounds overlap it.\n
+    Queries return objects in insertion order so results match looping over the object list."""
+
+    def __init__(self, cellSize: int, orderKey=None) -> None:
+        """orderKey -> function giving an object's position in the object list,
+        needed when the list is not append only"""
+        self.cellSize = cellSize
+        self.cells: dict[tuple[int, int], set[CoreObject]] = {}
+        self.bounds: dict[CoreObject, tuple[int, int, int, int]] = {}
+        self.order: dict[CoreObject, int] = {}
+        self.nextOrder = 0
+        self.orderKey = orderKey or self.order.__getitem__
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def __contains__(self, obj) -> bool:
+        return obj in self.bounds
+
+    def cellRange(self, rect: pg.Rect) -> tuple[int, int, int, int]:
+        size = self.cellSize
+        return (
+            rect.left // size,
+            rect.top // size,
+            max(rect.left, rect.right - 1) // size,
+            max(rect.top, rect.bottom - 1) // size,
+        )
+
+    def addToCells(self, obj, cellRange: tuple[int, int, int, int]) -> None:
+        left, top, right, bottom = cellRange
+        for cellX in range(left, right + 1):
+            for cellY in range(top, bottom + 1):
+                cell = self.cells.get((cellX, cellY))
+                if cell is None:
+                    self.cells[cellX, cellY] = cell = set()
+                cell.add(obj)
+
+    def removeFromCells(self, obj, cellRange: tuple[int, int, int, int]) -> None:
+        left, top, right, bottom = cellRange
+        for cellX in range(left, right + 1):
+            for cellY in range(top, bottom + 1):
+                cell = self.cells[cellX, cellY]
+                cell.discard(obj)
+                if not cell:
+                    del self.cells[cellX, cellY]
+
+    def insert(self, obj) -> None:
+        if obj in self.bounds:
+            return
+        cellRange = self.cellRange(collisionBounds(obj))
+        self.bounds[obj] = cellRange
+        self.order[obj] = self.nextOrder
+        self.nextOrder += 1
+        self.addToCells(obj, cellRange)
+
+    def remove(self, obj) -> None:
+        cellRange = self.bounds.pop(obj, None)
+        if cellRange is None:
+            return
+        del self.order[obj]
+        self.removeFromCells(obj, cellRange)
+
+    def update(self, obj) -> None:
+        "Call after obj's rect has moved"
+        oldRange = self.bounds.get(obj)
+        if oldRange is None:
+            return
+        newRange = self.cellRange(collisionBounds(obj))
+        if newRange == oldRange:
+            return
+        self.removeFromCells(obj, oldRange)
+        self.addToCells(obj, newRange)
+        self.bounds[obj] = newRange
+
+    def query(self, rect: pg.Rect) -> list[CoreObject]:
+        "Returns objects in cells overlapping rect, in list order"
+        left, top, right, bottom = self.cellRange(rect)
+        cells = self.cells
+        found = set()
+        for cellX in range(left, right + 1):
+            for cellY in range(top, bottom + 1):
+                cell = cells.get((cellX, cellY))
+                if cell:
+                    found.update(cell)
+        return sorted(found, key=self.orderKey)
+
+    def clear(self) -> None:
+        self.cells.clear()
+        self.bounds.clear()
+        self.order.clear()
+
+
 # -----------Base Player Class For All Collision Classes----------- #
 
 
 class CorePlayer(CoreObject):
-    x_vel, y_vel = 0, 0
+    __slots__ = ("x_vel", "y_vel", "isShifting")
     maxSpeed = 5
-    isShifting = False
     type = "Player"
+    collisionLayer = playerLayer
+    collisionMask = enemyLayer | staticLayer | pushableLayer
+    # "step" moves one pixel at a time, "sweep" finds the contact point with swept masks
+    movementResolution = "step"
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.x_vel, self.y_vel = 0, 0
+        self.isShifting = False
+        super().__init__(*args, **kwargs)
 
     def script(self, game):
         self.x_vel, self.y_vel = 0, 0
 
-        keys = pg.key.get_pressed()
+        keys = game.getPressed()
         if keys[pg.K_w]:
             self.y_vel -= self.maxSpeed
         if keys[pg.K_a]:
@@ -108,34 +662,172 @@ class CorePlayer(CoreObject):
         if event.key == pg.K_LSHIFT:
             self.isShifting = True
 
-    def collide(self, objects) -> list[CoreObject]:
-        "Returns Collided Objects"
-        collided_objects = []
-        for _ in range(round(abs(self.x_vel))):
-            self.rect.x += self.x_vel / abs(self.x_vel)
+    def sweptBounds(self) -> pg.Rect:
+        "Area that can be touched while moving by x_vel and y_vel this tick"
+        x_steps, y_steps = round(abs(self.x_vel)), round(abs(self.y_vel))
+        return collisionBounds(self).inflate(2 * (x_steps + 1), 2 * (y_steps + 1))
+
+    def queryNearby(self, grid: "SpatialHash", objects: list[CoreObject]) -> tuple[pg.Rect, list[CoreObject]]:
+        "Refreshes the candidates around the current position"
+        # candidates pushed so far have to be found again
+        for obj in objects:
+            if sweepResponse(obj) is None:
+                grid.update(obj)
+        area = self.sweptBounds()
+        return area, self.collidable(grid.query(area))
+
+    def collidable(self, objects: list[CoreObject]) -> list[CoreObject]:
+        "objects on a layer in collisionMask, the rest are counted in collisionStats.skippedPairs"
+        mask = self.collisionMask
+        kept = [obj for obj in objects if obj.collisionLayer & mask]
+        if len(kept) != len(objects):
+            skipped = collisionStats.skippedPairs
             for obj in objects:
-                if id(obj) == id(self):
-                    continue
-                if obj.resolveXCollision(self):
-                    collided_objects.append(obj)
-
-        for _ in range(round(abs(self.y_vel))):
-            self.rect.y += self.y_vel / abs(self.y_vel)
+                if not obj.collisionLayer & mask:
+                    name = layerNames.get(obj.collisionLayer, obj.collisionLayer)
+                    skipped[name] = skipped.get(name, 0) + 1
+        return kept
+
+    def collide(self, objects, grid: "SpatialHash" = None, contacts: "ContactEvents" = None, updateGrid: bool = True) -> list[CoreObject]:
+        """Returns Collided Objects, each once however many steps it was touched for\n
+        grid -> spatial hash holding objects, when given only objects near the movement are tested\n
+        contacts -> ContactEvents the (self, object) pairs touched are reported to\n
+        updateGrid -> False leaves moving self in grid to the caller"""
+        collisionStats.collideCalls += 1
+        if grid is not None:
+            area, objects = self.queryNearby(grid, [])
+        else:
+            objects = self.collidable(objects)
+        # insertion ordered set of everything touched
+        touched: dict[CoreObject, None] = {}
+        sweep = self.movementResolution == "sweep"
+        if not (sweep and self.sweepAxis(objects, 0, touched)):
+            for _ in range(round(abs(self.x_vel))):
+                self.rect.x += self.x_vel / abs(self.x_vel)
+                # several overlapping objects can push back further than the movement
+                if grid is not None and not area.contains(collisionBounds(self)):
+                    area, objects = self.queryNearby(grid, objects)
+                for obj in objects:
+                    if id(obj) == id(self):
+                        continue
+                    hit = obj.resolveXCollision(self)
+                    # compound objects such as tile chunks return the parts touched
+                    if isinstance(hit, list):
+                        for part in hit:
+                            touched[part] = None
+                    elif hit:
+                        touched[obj] = None
+
+        if grid is not None:
+            area, objects = self.queryNearby(grid, objects)
+        if not (sweep and self.sweepAxis(objects, 1, touched)):
+            for _ in range(round(abs(self.y_vel))):
+                self.rect.y += self.y_vel / abs(self.y_vel)
+                if grid is not None and not area.contains(collisionBounds(self)):
+                    area, objects = self.queryNearby(grid, objects)
+                for obj in objects:
+                    if id(obj) == id(self):
+                        continue
+                    hit = obj.resolveYCollision(self)
+                    if isinstance(hit, list):
+                        for part in hit:
+                            touched[part] = None
+                    elif hit:
+                        touched[obj] = None
+
+        if grid is not None:
+            if updateGrid:
+                grid.update(self)
             for obj in objects:
-                if id(obj) == id(self):
-                    continue
-                if obj.resolveYCollision(self):
-                    collided_objects.append(obj)
-        return collided_objects
+                if sweepResponse(obj) is None:
+                    grid.update(obj)
+        if contacts is not None:
+            for obj in touched:
+                contacts.report(self, obj)
+        return list(touched)
+
+    def sweepAxis(self, objects: list[CoreObject], axis: int, touched: dict[CoreObject, None]) -> bool:
+        """Moves along one axis (0 = x, 1 = y) in a logarithmic number of mask tests,
+        finishing where the stepwise loop would and reporting each contact once.\n
+        Returns False without moving when the objects need the stepwise loop"""
+        velocity = self.y_vel if axis else self.x_vel
+        steps = round(abs(velocity))
+        if steps == 0:
+            return True
+        direction = 1 if velocity > 0 else -1
+
+        candidates: list[tuple[CoreObject, bool]] = []
+        for obj in objects:
+            if id(obj) == id(self):
+                continue
+            response = sweepResponse(obj)
+            if response is None or response == "static":
+                return False
+            # stepping out of an overlapping object pushes back in ways a sweep does not model
+            if response == "solid" and collideMask(obj, self):
+                return False
+            candidates.append((obj, response == "solid"))
+
+        sweptMasks = {}
+
+        def hits(obj: CoreObject, first: int, last: int) -> bool:
+            "Whether obj overlaps self anywhere between first and last steps along the axis"
+            collisionStats.maskTests += 1
+            swept = sweptMasks.get((first, last))
+            if swept is None:
+                swept = sweptMasks[first, last] = sweptMask(self.mask, last - first + 1, axis)
+            start = min(first * direction, last * direction)
+            x = self.rect.x + (0 if axis else start)
+            y = self.rect.y + (start if axis else 0)
+            return obj.mask.overlap(swept, (x - obj.rect.x, y - obj.rect.y)) is not None
+
+        solids = [obj for obj, solid in candidates if solid]
+        blockedAt = None
+        if any(hits(obj, 1, steps) for obj in solids):
+            # first step touching a solid, found by binary search over the swept distance
+            low, high = 1, steps
+            while low < high:
+                middle = (low + high) // 2
+                if any(hits(obj, 1, middle) for obj in solids):
+                    high = middle
+                else:
+                    low = middle + 1
+            blockedAt = low
+        free = steps if blockedAt is None else blockedAt - 1
+
+        blocker = None
+        if blockedAt is not None:
+            blocker = next(obj for obj in solids if hits(obj, blockedAt, blockedAt))
+        beforeBlocker = True
+        for obj, solid in candidates:
+            if obj is blocker:
+                beforeBlocker = False
+                touched[obj] = None
+                continue
+            if solid:
+                continue
+            if free and hits(obj, 1, free):
+                touched[obj] = None
+            elif blocker is not None:
+                # objects after the blocker are tested once it has pushed self back
+                if hits(obj, blockedAt, blockedAt) if beforeBlocker else (free == 0 and hits(obj, 0, 0)):
+                    touched[obj] = None
+
+        if axis:
+            self.rect.y += free * direction
+        else:
+            self.rect.x += free * direction
+        return True
 
 # -----------Base Class For All Collision Classes----------- #
 
 
 class Object(CoreObject):
+    __slots__ = ()
 
     # Call this method after adding a player's x velocity / player's x velocity
     def resolveXCollision(self, player: CorePlayer) -> bool:
-        if not pg.sprite.collide_mask(self, player):
+        if not collideMask(self, player):
             return False
         player.rect.x -= player.x_vel / abs(player.x_vel)
         return True
@@ -143,7 +835,7 @@ class Object(CoreObject):
 
     # Call this method after adding a player's y velocity / player's y velocity
     def resolveYCollision(self, player: CorePlayer) -> bool:
-        if not pg.sprite.collide_mask(self, player):
+        if not collideMask(self, player):
             return False
         player.rect.y -= player.y_vel / abs(player.y_vel)
         return True
@@ -153,38 +845,44 @@ class Object(CoreObject):
 
 
 class PushableObject(CoreObject):
+    __slots__ = ()
+    collisionLayer = pushableLayer
+
     # Call this method after adding a player's x velocity / player's x velocity
-    def resolveXCollision(self, player: CorePlayer) -> CorePlayer:
-        if not pg.sprite.collide_mask(self, player):
-            return player
+    def resolveXCollision(self, player: CorePlayer) -> bool:
+        if not collideMask(self, player):
+            return False
         self.rect.x += player.x_vel / abs(player.x_vel)
-        return player
+        return True
 
 
     # Call this method after adding a player's y velocity / player's y velocity
-    def resolveYCollision(self, player: CorePlayer) -> CorePlayer:
-        if not pg.sprite.collide_mask(self, player):
-            return player
+    def resolveYCollision(self, player: CorePlayer) -> bool:
+        if not collideMask(self, player):
+            return False
         self.rect.y += player.y_vel / abs(player.y_vel)
-        return player
+        return True
 
 
 # -----------Free Moving, Mouse Facing Player----------- #
 
 
 class Player(CorePlayer):
-    angle = 0
     speed = 0.0
     acceleration = 0.3
     rotateSpeed = 10
 
-    def __init__(self, x: int, y: int, name: str, hitbox: pg.Rect | pg.Surface, correctionAngle: int = 0, scale: int = 1, angle: int = 0) -> None:
+    def __init__(self, x: int, y: int, name: str, hitbox: pg.Rect | pg.Surface, correctionAngle: int = 0, scale: int = 1, angle: int = 0, rotationStep: int | float = None) -> None:
         """correctionAngle -> should make it so that when the
         object is rotated by that amount it faces up.\n
         hitbox -> either image or a rect which is relative to the x and y,
-        the hitbox will scale automatically"""
+        the hitbox will scale automatically\n
+        rotationStep -> degrees between pre-rotated images, turning
+        then snaps to the nearest one instead of rotating every frame"""
         # code order fix
         self.hitbox = None
+        if rotationStep is not None:
+            self.rotationStep = rotationStep
 
         super().__init__(x, y, name, scale, angle)
         self.correctionAngle = correctionAngle
@@ -198,8 +896,8 @@ class Player(CorePlayer):
             hitbox[1] *= scale
             hitbox[2] *= scale
             hitbox[3] *= scale
-            image = pg.Surface((self.rect.width, self.rect.height)).convert_alpha()
-            image.fill((0, 0, 0, 0))
+            # no convert_alpha so players can be built without a display
+            image = pg.Surface((self.rect.width, self.rect.height), pg.SRCALPHA)
             image.fill((255, 255, 255, 255), hitbox)
             self.mask = pg.mask.from_surface(image)
         self.hitbox: pg.mask.Mask = self.mask
@@ -223,7 +921,7 @@ class Player(CorePlayer):
         x_offset: int = game.x_offset
         y_offset: int = game.y_offset
 
-        keys = pg.key.get_pressed()
+        keys = game.getPressed()
         if keys[pg.K_w]:
             self.speed += self.acceleration
         elif keys[pg.K_s]:
@@ -234,7 +932,7 @@ class Player(CorePlayer):
 
         self.speed = clamp(-self.maxSpeed, self.speed, self.maxSpeed)
 
-        mouseX, mouseY = pg.mouse.get_pos()
+        mouseX, mouseY = game.getMousePos()
         mouseX += x_offset
         mouseY += y_offset
 
@@ -262,7 +960,7 @@ class Chair(Object):
         self.type = "Chair"
 
     def resolveXCollision(self, player: CorePlayer) -> bool:
-        if not pg.sprite.collide_mask(self, player):
+        if not collideMask(self, player):
             return False
         if player.isSitting and time.time() - player.timeSinceSatUp > player.satUpCoolDown:
             player.rect.center = self.rect.center
@@ -275,7 +973,7 @@ class Chair(Object):
     def resolveYCollision(self, player: CorePlayer) -> bool:
         if player.satUp:
             player.rect.bottom = self.rect.top
-        if not pg.sprite.collide_mask(self, player):
+        if not collideMask(self, player):
             return False
         if player.isSitting:
             player.rect.center = self.rect.center
@@ -299,7 +997,7 @@ class Door(Object):
     def resolveXCollision(self, player: CorePlayer) -> CorePlayer:
         if self.orentation == "horizontal":
             return super().resolveXCollision(player)
-        while pg.sprite.collide_mask(self, player) and self.iter < self.maxSwing:
+        while collideMask(self, player) and self.iter < self.maxSwing:
             try:
                 self.angle += (player.x_vel / abs(player.x_vel)) * -1
             except ZeroDivisionError:
@@ -312,7 +1010,7 @@ class Door(Object):
     def resolveYCollision(self, player: CorePlayer) -> CorePlayer:
         if self.orentation == "vertical":
             return super().resolveYCollision(player)
-        while pg.sprite.collide_mask(self, player) and self.iter < self.maxSwing:
+        while collideMask(self, player) and self.iter < self.maxSwing:
             try:
                 self.angle += (player.y_vel / abs(player.x_vel)) * -1
             except ZeroDivisionError:
@@ -328,17 +1026,94 @@ class Door(Object):
 
 
 class Enemy(CorePlayer):
+    __slots__ = ("localXVel", "localYVel", "localSpeed", "localHealth", "store", "storeIndex")
     type = "Enemy"
+    collisionLayer = enemyLayer
+    # enemies pass through each other
+    collisionMask = playerLayer | staticLayer | pushableLayer
 
     def __init__(self, x, y, name, scale=1, angle=0, size=None, speed=1, data=None):
+        # set by entities.EnemyStore, velocity, speed and health are then views into its arrays
+        self.store = None
+        self.storeIndex = 0
+        self.localXVel, self.localYVel = 0, 0
+        self.localHealth = None
         super().__init__(x, y, name, scale, angle, size, data)
         self.speed = speed
 
+    @property
+    def x_vel(self):
+        if self.store is None:
+            return self.localXVel
+        return self.store.velocity[self.storeIndex, 0]
+
+    @x_vel.setter
+    def x_vel(self, value):
+        if self.store is None:
+            self.localXVel = value
+        else:
+            self.store.velocity[self.storeIndex, 0] = value
+
+    @property
+    def y_vel(self):
+        if self.store is None:
+            return self.localYVel
+        return self.store.velocity[self.storeIndex, 1]
+
+    @y_vel.setter
+    def y_vel(self, value):
+        if self.store is None:
+            self.localYVel = value
+        else:
+            self.store.velocity[self.storeIndex, 1] = value
+
+    @property
+    def speed(self):
+        if self.store is None:
+            return self.localSpeed
+        return self.store.speed[self.storeIndex]
+
+    @speed.setter
+    def speed(self, value):
+        if self.store is None:
+            self.localSpeed = value
+        else:
+            self.store.speed[self.storeIndex] = value
+
+    @property
+    def health(self):
+        if self.store is None or self.localHealth is None:
+            return self.localHealth
+        return self.store.health.item(self.storeIndex)
+
+    @health.setter
+    def health(self, value):
+        self.localHealth = value
+        if self.store is not None and value is not None:
+            self.store.health[self.storeIndex] = value
+
+    def cloneInto(self, obj: "Enemy", x: int, y: int, data=None) -> "Enemy":
+        super().cloneInto(obj, x, y)
+        # the copy starts outside any store
+        obj.store = None
+        obj.localXVel, obj.localYVel = self.x_vel, self.y_vel
+        obj.localSpeed = self.speed
+        obj.data = data
+        return obj
+
     def script(self, game):
+        # enemies in a store are moved together by entities.update_enemies
+        if self.store is not None:
+            return
         player: CorePlayer = game.player
 
         self.x_vel = player.rect.x - self.rect.x
         self.y_vel = player.rect.y - self.rect.y
+        field = getattr(game, "flowField", None)
+        waypoint = None if field is None else field.waypoint(*self.rect.center)
+        if waypoint is not None:
+            self.x_vel = waypoint[0] - self.rect.centerx
+            self.y_vel = waypoint[1] - self.rect.centery
         if self.x_vel != 0:
             self.x_vel /= abs(self.x_vel)
             self.x_vel *= self.speed
@@ -355,5 +1130,75 @@ class MouseClick(Object):
         super().__init__(x, y, "Flat Black", 1, 0)
 
 
+# -----------Object Pool----------- #
+
+
+class ObjectPool:
+    """Recycles objects of one class and look instead of constructing new ones.\n
+    Objects come out of acquire() as a fresh copy of a template built once from the
+    constructor arguments, release() takes them back once despawned.\n
+    maxSize -> released objects kept, extra ones are left to the garbage collector"""
+
+    def __init__(self, cls: type, name: str, scale: int | float = 1, angle: int = 0, size=None, maxSize: int = 256, **kwargs) -> None:
+        self.template: CoreObject = cls(0, 0, name, scale, angle, size, **kwargs)
+        # constructors centre scaled sprites, x, y maps to rect.topleft + offset
+        self.offset = self.template.rect.topleft
+        self.maxSize = maxSize
+        self.free: list[CoreObject] = []
+        self.created, self.reused, self.released, self.dropped = 0, 0, 0, 0
+
+    def __len__(self) -> int:
+        return len(self.free)
+
+    def acquire(self, x: int, y: int, data=None) -> CoreObject:
+        "An object placed as constructing it at x, y would, with data"
+        x, y = x + self.offset[0], y + self.offset[1]
+        if self.free:
+            obj = self.template.cloneInto(self.free.pop(), x, y, data)
+            self.reused += 1
+        else:
+            obj = self.template.clone(x, y, data)
+            self.created += 1
+        obj.pool = self
+        return obj
+
+    def release(self, obj: CoreObject) -> None:
+        "Call once obj is despawned and nothing refers to it"
+        self.released += 1
+        if len(self.free) >= self.maxSize:
+            self.dropped += 1
+            return
+        # shared surfaces stay with the template, settings overridden on obj do not.
+        # object.__getstate__ reads the overrides without creating a __dict__ when there are none
+        obj.data = None
+        if object.__getstate__(obj)[0]:
+            obj.__dict__.clear()
+        self.free.append(obj)
+
+    def prefill(self, count: int) -> None:
+        "Creates objects up front so the first acquires reuse them"
+        while len(self.free) < min(count, self.maxSize):
+            self.free.append(self.template.clone(0, 0))
+            self.created += 1
+
+    def stats(self) -> dict:
+        acquired = self.created + self.reused
+        return {
+            "free": len(self.free),
+            "created": self.created,
+            "reused": self.reused,
+            "released": self.released,
+            "dropped": self.dropped,
+            "reuseRate": self.reused / acquired if acquired else 0.0,
+        }
+
+
 # -----------Object Map----------- #
-objectMap = {"Object": Object, "Chair": Chair}
\ No newline at end of file
+objectMap = {
+    "CoreObject": CoreObject,
+    "Object": Object,
+    "PushableObject": PushableObject,
+    "Chair": Chair,
+    "Door": Door,
+    "Enemy": Enemy,
+}
\ No newline at end of file
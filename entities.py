@@ -0,0 +1,288 @@
+"""Entity Storage For Pygame Games"""
+import numpy as np
+
+from collision import CoreObject
+
+
+# -----------Entity Registry----------- #
+
+
+class EntityRegistry:
+    """Dense list of live objects addressed by stable handles.\n
+    despawn() only queues, flush() then removes each queued object by
+    swapping the last object into its slot."""
+
+    def __init__(self) -> None:
+        self.objects: list = []
+        self.slots: dict[int, int] = {}
+        self.nextHandle = 1
+        self.despawnQueue: list = []
+        self.queued: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __contains__(self, obj) -> bool:
+        slot = self.slots.get(obj.handle)
+        return slot is not None and self.objects[slot] is obj
+
+    def spawn(self, obj) -> int:
+        "Adds obj and returns its handle, objects spawned again keep the handle they had"
+        handle = obj.handle
+        if handle is None or handle in self.slots:
+            handle = self.nextHandle
+            self.nextHandle += 1
+        obj.handle = handle
+        self.slots[handle] = len(self.objects)
+        self.objects.append(obj)
+        return handle
+
+    def get(self, handle: int):
+        "Returns the object for handle or None once it has been despawned"
+        slot = self.slots.get(handle)
+        if slot is None:
+            return None
+        return self.objects[slot]
+
+    def slotOf(self, obj) -> int:
+        return self.slots[obj.handle]
+
+    def despawn(self, obj) -> None:
+        "Queues obj for removal at the next flush, repeated calls are ignored"
+        if obj.handle in self.queued or obj not in self:
+            return
+        self.queued.add(obj.handle)
+        self.despawnQueue.append(obj)
+
+    def flush(self) -> list:
+        "Removes queued objects and returns them"
+        removed = self.despawnQueue
+        objects, slots = self.objects, self.slots
+        for obj in removed:
+            slot = slots.pop(obj.handle)
+            last = objects.pop()
+            if last is not obj:
+                objects[slot] = last
+                slots[last.handle] = slot
+        self.despawnQueue = []
+        self.queued.clear()
+        return removed
+
+
+# -----------Enemy Store----------- #
+
+
+class EnemyStore:
+    """Structure of arrays holding enemy positions, velocities, speeds and health.\n
+    Added enemies become views over their row, removal swaps the last row into the gap."""
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.enemies: list = []
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)
+        self.health = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.enemies)
+
+    def __contains__(self, enemy) -> bool:
+        return enemy.store is self
+
+    def grow(self) -> None:
+        capacity = len(self.speed) * 2
+        for name in ("position", "velocity", "speed", "health"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, enemy) -> None:
+        if enemy.store is self:
+            return
+        index = len(self.enemies)
+        if index == len(self.speed):
+            self.grow()
+        self.position[index] = enemy.rect.topleft
+        self.velocity[index] = enemy.localXVel, enemy.localYVel
+        self.speed[index] = enemy.localSpeed
+        self.health[index] = enemy.localHealth or 0
+        enemy.store, enemy.storeIndex = self, index
+        self.enemies.append(enemy)
+
+    def remove(self, enemy) -> None:
+        "Detaches enemy, its current values are copied back onto it"
+        if enemy.store is not self:
+            return
+        index = enemy.storeIndex
+        enemy.localXVel, enemy.localYVel = self.velocity[index].tolist()
+        enemy.localSpeed = self.speed[index].item()
+        if enemy.localHealth is not None:
+            enemy.localHealth = self.health.item(index)
+        enemy.store = None
+
+        last = len(self.enemies) - 1
+        moved = self.enemies.pop()
+        if index != last:
+            for array in (self.position, self.velocity, self.speed, self.health):
+                array[index] = array[last]
+            self.enemies[index] = moved
+            moved.storeIndex = index
+
+    def clear(self) -> None:
+        for enemy in reversed(self.enemies):
+            self.remove(enemy)
+
+
+def update_enemies(game) -> None:
+    """Sets every enemy in game.enemies to chase game.player in one vectorized pass,
+    following game.flowField around obstacles when the game has one"""
+    store: EnemyStore = game.enemies
+    count = len(store.enemies)
+    if not count:
+        return
+    position = store.position[:count]
+    # rects are moved by collide so positions are gathered back each tick
+    position[:] = [enemy.rect.topleft for enemy in store.enemies]
+    target = np.array(game.player.rect.topleft, dtype=position.dtype)
+    offset = target - position
+    scheduler = getattr(game, "scheduler", None)
+    # distance to the player decides how often, before offset is turned towards the next waypoint
+    due = None if scheduler is None else scheduler.dueRows(offset)
+    field = getattr(game, "flowField", None)
+    if field is not None:
+        centers = np.array([enemy.rect.center for enemy in store.enemies], dtype=position.dtype)
+        waypoints, valid = field.waypoints(centers)
+        offset[valid] = waypoints[valid] - centers[valid]
+    if due is None:
+        np.multiply(np.sign(offset), store.speed[:count, None], out=store.velocity[:count])
+        return
+    # far enemies keep their last velocity between updates
+    store.velocity[:count][due] = np.sign(offset[due]) * store.speed[:count, None][due]
+
+
+# -----------Tick Scheduler----------- #
+
+
+scriptedClasses: dict[type, bool] = {}
+
+
+def isDynamic(obj) -> bool:
+    "Whether obj has a script or collides into anything, anything else never needs ticking"
+    cls = type(obj)
+    scripted = scriptedClasses.get(cls)
+    if scripted is None:
+        scripted = scriptedClasses[cls] = cls.script is not CoreObject.script
+    # collisionMask can be set per object
+    return scripted or bool(obj.collisionMask)
+
+
+class TickScheduler:
+    """The dynamic objects of a world, those with a script or a collisionMask, so a tick
+    costs as much as the objects that can change rather than everything spawned.\n
+    Colliding objects that neither move nor touch anything for sleepAfter ticks sleep, skipping
+    their script and collide until the player moves or an obstacle is added or removed.\n
+    farDistance -> pixels from the player beyond which an object only thinks every farInterval ticks, None for never\n
+    farInterval -> ticks between script updates of far objects"""
+
+    def __init__(self, sleepAfter: int = 30, farDistance: int = None, farInterval: int = 4) -> None:
+        self.sleepAfter = sleepAfter
+        self.farDistance = farDistance
+        self.farInterval = farInterval
+        self.entities: list = []
+        self.slots: dict[int, int] = {}
+        # per entity, in the same order as entities
+        self.lastPositions: list[tuple[int, int]] = []
+        self.idleTicks: list[int] = []
+        self.wakeKey = None
+        self.ticks = 0
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def __contains__(self, obj) -> bool:
+        slot = self.slots.get(obj.handle)
+        return slot is not None and self.entities[slot] is obj
+
+    def add(self, obj) -> bool:
+        "Starts ticking obj if it is dynamic, returns whether it was added"
+        if not isDynamic(obj) or obj in self:
+            return False
+        self.slots[obj.handle] = len(self.entities)
+        self.entities.append(obj)
+        self.lastPositions.append(obj.rect.topleft)
+        self.idleTicks.append(0)
+        return True
+
+    def remove(self, obj) -> None:
+        if obj not in self:
+            return
+        slot = self.slots.pop(obj.handle)
+        last = self.entities.pop()
+        lastPosition, lastIdle = self.lastPositions.pop(), self.idleTicks.pop()
+        if last is not obj:
+            self.entities[slot] = last
+            self.lastPositions[slot], self.idleTicks[slot] = lastPosition, lastIdle
+            self.slots[last.handle] = slot
+
+    def clear(self) -> None:
+        self.entities.clear()
+        self.slots.clear()
+        self.lastPositions.clear()
+        self.idleTicks.clear()
+
+    def sleeping(self, obj) -> bool:
+        return self.sleepAfter is not None and self.idleTicks[self.slots[obj.handle]] >= self.sleepAfter
+
+    def begin(self, game) -> None:
+        "Call at the start of each tick, wakes everything when what sleepers wait on changed"
+        self.ticks += 1
+        key = game.player.rect.topleft, game.tiles.version, game.flowField.solidVersion
+        if key != self.wakeKey:
+            self.wakeKey = key
+            self.idleTicks = [0] * len(self.entities)
+
+    def awake(self) -> list:
+        "Entities not sleeping, in update order"
+        if self.sleepAfter is None:
+            return list(self.entities)
+        sleepAfter = self.sleepAfter
+        return [obj for obj, idle in zip(self.entities, self.idleTicks) if idle < sleepAfter]
+
+    def due(self, game, objects: list) -> list:
+        "Those of objects whose script runs this tick"
+        if self.farDistance is None:
+            return objects
+        x, y = game.player.rect.center
+        far, interval, tick = self.farDistance, self.farInterval, self.ticks
+        return [
+            obj for obj in objects
+            if max(abs(obj.rect.centerx - x), abs(obj.rect.centery - y)) <= far or obj.handle % interval == tick % interval
+        ]
+
+    def dueRows(self, offset: np.ndarray) -> np.ndarray:
+        "update_enemies' version of due(), offset holds each store row's (x, y) to the player"
+        due = np.ones(len(offset), dtype=bool)
+        if self.farDistance is None:
+            return due
+        far = np.abs(offset).max(axis=1) > self.farDistance
+        rows = np.arange(len(offset))
+        due[far] = rows[far] % self.farInterval == self.ticks % self.farInterval
+        return due
+
+    def settle(self, obj, touched: bool) -> None:
+        "Call after obj's collide, touched being whether it hit anything"
+        slot = self.slots[obj.handle]
+        position = obj.rect.topleft
+        if touched or position != self.lastPositions[slot]:
+            self.lastPositions[slot] = position
+            self.idleTicks[slot] = 0
+        else:
+            self.idleTicks[slot] += 1
+
+    def stats(self) -> dict:
+        awake = len(self.awake())
+        return {"entities": len(self.entities), "awake": awake, "sleeping": len(self.entities) - awake}
@@ -1,9 +1,123 @@
 import pygame as pg
-from os import listdir
-from os.path import isfile, isdir, join
+from os import fdopen, listdir, makedirs, remove, replace, stat
+from os.path import isfile, isdir, join, exists
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
 import json
+import struct
+import sys
+import tempfile
+import threading
 
 pg.font.init()
+
+# -----------Font And Text Caches----------- #
+
+fonts: dict[tuple, pg.font.Font] = {}
+
+
+def get_font(file: str, size: int) -> pg.font.Font:
+    "Shared pg.font.Font for a .ttf file, opened once per (file, size)"
+    font = fonts.get((file, size))
+    if font is None:
+        font = fonts[file, size] = pg.font.Font(file, size)
+    return font
+
+
+def get_sys_font(name: str, size: int) -> pg.font.Font:
+    "Shared pg.font.SysFont, looked up once per (name, size)"
+    font = fonts.get((None, name, size))
+    if font is None:
+        font = fonts[None, name, size] = pg.font.SysFont(name, size)
+    return font
+
+
+class TextCache:
+    "LRU cache of rendered strings, surfaces are shared so they must not be drawn on"
+
+    def __init__(self, maxEntries: int = 256) -> None:
+        self.maxEntries = maxEntries
+        self.entries: OrderedDict[tuple, pg.Surface] = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def render(self, font: pg.font.Font, text: str, colour, antialias: bool = True) -> pg.Surface:
+        key = (font, text, tuple(colour), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.entries[key] = font.render(text, antialias, colour)
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+textCache = TextCache()
+
+
+class GlyphAtlas:
+    """Every glyph of characters rendered once into a single surface.\n
+    Text made of those characters is drawn as one area blit per glyph, for
+    text that changes often like counters. Other characters are added when first used."""
+
+    def __init__(self, font: pg.font.Font, colour, characters: str = "0123456789", antialias: bool = True) -> None:
+        self.font = font
+        self.colour = colour
+        self.antialias = antialias
+        self.height = font.get_linesize()
+        self.areas: dict[str, pg.Rect] = {}
+        self.widths: dict[str, int] = {}
+        self.atlas = pg.Surface((0, 0), pg.SRCALPHA)
+        self.blank: pg.Surface = None
+        self.add(characters)
+
+    def add(self, characters: str) -> None:
+        if self.areas.keys() >= set(characters):
+            return
+        characters = "".join(dict.fromkeys(character for character in characters if character not in self.areas))
+        glyphs = [self.font.render(character, self.antialias, self.colour) for character in characters]
+        x = self.atlas.get_width()
+        height = max([self.height, self.atlas.get_height()] + [glyph.get_height() for glyph in glyphs])
+        atlas = pg.Surface((x + sum(glyph.get_width() for glyph in glyphs), height), pg.SRCALPHA)
+        atlas.blit(self.atlas, (0, 0))
+        for character, glyph in zip(characters, glyphs):
+            atlas.blit(glyph, (x, 0))
+            self.areas[character] = pg.Rect(x, 0, glyph.get_width(), glyph.get_height())
+            self.widths[character] = glyph.get_width()
+            x += glyph.get_width()
+        self.atlas = atlas
+
+    def erase(self, surface: pg.Surface, rect: pg.Rect) -> None:
+        "Makes rect fully transparent, min blending with a blank surface is much cheaper than fill on alpha surfaces"
+        blank = self.blank
+        if blank is None or blank.get_width() < rect.width or blank.get_height() < rect.height:
+            blank = self.blank = pg.Surface(rect.size, pg.SRCALPHA)
+        surface.blit(blank, rect, (0, 0, rect.width, rect.height), pg.BLEND_RGBA_MIN)
+
+    def size(self, text: str) -> tuple[int, int]:
+        self.add(text)
+        return sum(map(self.widths.__getitem__, text)), self.height
+
+    def draw(self, surface: pg.Surface, text: str, pos, special_flags: int = 0) -> pg.Rect:
+        "Blits text onto surface with its top left at pos"
+        self.add(text)
+        x, y = pos
+        blits = []
+        for character in text:
+            area = self.areas[character]
+            blits.append((self.atlas, (x, y), area, special_flags))
+            x += area.width
+        surface.blits(blits, False)
+        return pg.Rect(pos, (x - pos[0], self.height))
+
+
 def blit_text(
     win,
     text,
@@ -15,11 +129,16 @@ def blit_text(
     centerx=False,
     centery=False,
     center=False,
+    cache=False,
 ):
+    "cache -> reuse the rendered surface of identical text through textCache"
     text = str(text)
     x, y = pos
-    font_style = pg.font.SysFont(font, size)
-    text_surface = font_style.render(text, True, colour)
+    font_style = get_sys_font(font, size)
+    if cache:
+        text_surface = textCache.render(font_style, text, colour)
+    else:
+        text_surface = font_style.render(text, True, colour)
     if center:
         x -= text_surface.get_width() // 2
         y -= text_surface.get_height() // 2
@@ -33,7 +152,288 @@ def blit_text(
     return text_surface
 
 
-def load_assets(path, size: int = None, scale: float = None, getSubDirsAsList=False, scaleifsize=None):
+class AssetCache:
+    """On-disk cache of decoded sprites and their mask bitmaps stored as raw buffers.\n
+    Entries are keyed on the source file's content hash and the size / scale applied,
+    the hash is only recomputed when the file's mtime changes."""
+
+    magic = b"BRPG"
+    header = struct.Struct("<4sIIII")
+
+    def __init__(self, cacheDir: str) -> None:
+        self.cacheDir = cacheDir
+        self.indexPath = join(cacheDir, "index.json")
+        self.index: dict[str, dict] = {}
+        if isfile(self.indexPath):
+            try:
+                self.index = loadJson(self.indexPath)
+            except ValueError:
+                self.index = {}
+        self.hits, self.misses = 0, 0
+        self.changed = False
+        # sprites may be loaded from several threads
+        self.lock = threading.RLock()
+
+    def fileHash(self, file: str) -> str:
+        "Content hash of file, reusing the stored one while its mtime is unchanged"
+        with self.lock:
+            return self.updateHash(file)
+
+    def updateHash(self, file: str) -> str:
+        mtime = stat(file).st_mtime_ns
+        entry = self.index.get(file)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["hash"]
+        with open(file, "rb") as source:
+            digest = hashlib.sha1(source.read()).hexdigest()
+        if entry is not None and entry["hash"] != digest:
+            self.removeEntries(entry["hash"])
+        self.index[file] = {"mtime": mtime, "hash": digest}
+        self.changed = True
+        return digest
+
+    def entryPath(self, digest: str, size, scale) -> str:
+        # mask buffers are machine words so the layout is part of the key
+        variant = f"{size[0]}x{size[1]}" if size is not None else f"s{scale}"
+        return join(self.cacheDir, f"{digest}-{variant}-{sys.byteorder}{struct.calcsize('L')}.bin")
+
+    def removeEntries(self, digest: str) -> None:
+        if not isdir(self.cacheDir):
+            return
+        for file in listdir(self.cacheDir):
+            if file.startswith(digest):
+                remove(join(self.cacheDir, file))
+
+    def isFresh(self, file: str, size=None, scale=None) -> bool:
+        "Whether loading file would be served from the cache"
+        return exists(self.entryPath(self.fileHash(file), size, scale))
+
+    def load(self, file: str, size=None, scale=None) -> tuple[pg.Surface, pg.mask.Mask]:
+        "Returns (surface, mask) for file scaled to size or by scale"
+        path = self.entryPath(self.fileHash(file), size, scale)
+        if isfile(path):
+            cached = self.readEntry(path)
+            if cached is not None:
+                with self.lock:
+                    self.hits += 1
+                return cached
+
+        with self.lock:
+            self.misses += 1
+        surface = pg.image.load(file)
+        if size is not None:
+            surface = pg.transform.scale(surface, size)
+        elif scale is not None:
+            surface = pg.transform.scale_by(surface, scale)
+        mask = pg.mask.from_surface(surface)
+        pixels = pg.image.tobytes(surface, "RGBA")
+        maskBits = memoryview(mask).cast("B").tobytes()
+        self.writeFile(path, self.header.pack(self.magic, *surface.get_size(), len(pixels), len(maskBits)) + pixels + maskBits)
+        return surface, mask
+
+    def readEntry(self, path: str):
+        "(surface, mask) stored at path, None if the entry is damaged or only partly written"
+        with open(path, "rb") as entry:
+            data = memoryview(bytearray(entry.read()))
+        if len(data) < self.header.size:
+            return None
+        magic, width, height, surfaceLength, maskLength = self.header.unpack_from(data)
+        start = self.header.size
+        if magic != self.magic or surfaceLength != width * height * 4 or len(data) != start + surfaceLength + maskLength:
+            return None
+        mask = pg.mask.Mask((width, height))
+        maskBytes = memoryview(mask).cast("B")
+        if len(maskBytes) != maskLength:
+            return None
+        surface = pg.image.frombuffer(data[start:start + surfaceLength], (width, height), "RGBA")
+        maskBytes[:] = data[start + surfaceLength:]
+        return surface, mask
+
+    def writeFile(self, path: str, data: bytes) -> None:
+        "Writes data to a temporary file and renames it over path, so readers never see half of it"
+        makedirs(self.cacheDir, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(".tmp", ".", self.cacheDir)
+        try:
+            with fdopen(handle, "wb") as file:
+                file.write(data)
+            replace(temporary, path)
+        except BaseException:
+            remove(temporary)
+            raise
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.changed:
+                return
+            self.writeFile(self.indexPath, json.dumps(self.index).encode())
+            self.changed = False
+
+    def clear(self) -> None:
+        "Invalidates every entry"
+        for digest in {entry["hash"] for entry in self.index.values()}:
+            self.removeEntries(digest)
+        self.index = {}
+        self.changed = True
+        self.save()
+
+
+def png_size(file: str) -> tuple[int, int]:
+    "Reads a png's size from its header without decoding it"
+    with open(file, "rb") as source:
+        header = source.read(24)
+    return struct.unpack(">II", header[16:24])
+
+
+class LazyAssets(MutableMapping):
+    """Sprites in a folder, decoded on first access instead of at import.\n
+    groups -> names of sprite lists that prefetch() warms on a thread pool,
+    peek() returns a placeholder of the right size until a sprite is ready"""
+
+    placeholderColour = (255, 0, 255, 120)
+
+    def __init__(self, path: str, cache: AssetCache = None, masks: dict = None, groups: dict[str, list[str]] = None, workers: int = 4) -> None:
+        self.path = path
+        self.cache = cache
+        self.masks = masks
+        self.groups = groups or {}
+        self.workers = workers
+        self.files = {
+            file.replace(".png", ""): join(path, file)
+            for file in listdir(path)
+            if file.endswith(".png") and isfile(join(path, file))
+        }
+        self.loaded: dict[str, pg.Surface] = {}
+        self.futures: dict[str, Future] = {}
+        self.placeholders: dict[tuple[int, int], pg.Surface] = {}
+        self.executor: ThreadPoolExecutor = None
+        self.convert = False
+        # bumped whenever a sprite finishes loading, so placeholder users know to reload
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> pg.Surface:
+        sprite = self.loaded.get(name)
+        if sprite is not None:
+            return sprite
+        future = self.futures.get(name)
+        if future is not None:
+            return future.result()
+        if name not in self.files:
+            raise KeyError(name)
+        return self.load(name)
+
+    def __setitem__(self, name: str, sprite: pg.Surface) -> None:
+        self.loaded[name] = sprite
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        self.loaded.pop(name, None)
+        self.files.pop(name, None)
+
+    def __contains__(self, name) -> bool:
+        return name in self.loaded or name in self.files
+
+    def __iter__(self):
+        return iter(self.files.keys() | self.loaded.keys())
+
+    def __len__(self) -> int:
+        return len(self.files.keys() | self.loaded.keys())
+
+    def load(self, name: str) -> pg.Surface:
+        "Decodes name now, on the calling thread"
+        file = self.files[name]
+        if self.cache is not None:
+            sprite, mask = self.cache.load(file)
+            self.cache.save()
+            if self.masks is not None:
+                self.masks[name] = mask
+        else:
+            sprite = pg.image.load(file)
+        if self.convert:
+            sprite = sprite.convert_alpha()
+        with self.lock:
+            if name not in self.loaded:
+                self.loaded[name] = sprite
+                self.version += 1
+            self.futures.pop(name, None)
+            return self.loaded[name]
+
+    def isReady(self, name: str) -> bool:
+        return name in self.loaded
+
+    def size(self, name: str) -> tuple[int, int]:
+        "A sprite's size, read from the png header until it has been decoded"
+        sprite = self.loaded.get(name)
+        if sprite is not None:
+            return sprite.get_size()
+        return png_size(self.files[name])
+
+    def prefetch(self, *groups: str) -> list[Future]:
+        "Starts decoding every sprite in groups (or sprite names) in the background"
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="assets")
+        futures = []
+        for group in groups:
+            for name in self.groups.get(group, [group]):
+                with self.lock:
+                    if name in self.loaded:
+                        continue
+                    future = self.futures.get(name)
+                    if future is None:
+                        future = self.futures[name] = self.executor.submit(self.load, name)
+                futures.append(future)
+        return futures
+
+    def placeholder(self, name: str) -> pg.Surface:
+        size = png_size(self.files[name])
+        placeholder = self.placeholders.get(size)
+        if placeholder is None:
+            placeholder = self.placeholders[size] = pg.Surface(size, pg.SRCALPHA)
+            placeholder.fill(self.placeholderColour)
+        return placeholder
+
+    def peek(self, name: str) -> pg.Surface:
+        "Returns the sprite if it is ready, otherwise starts loading it and returns a placeholder"
+        sprite = self.loaded.get(name)
+        if sprite is not None:
+            return sprite
+        if name not in self.files:
+            raise KeyError(name)
+        self.prefetch(name)
+        return self.placeholder(name)
+
+    def wait(self) -> None:
+        "Blocks until every prefetch has finished"
+        for future in list(self.futures.values()):
+            future.result()
+
+    def convertToDisplay(self) -> None:
+        "Converts loaded sprites and every later one to the display's pixel format"
+        self.convert = True
+        with self.lock:
+            for name, sprite in self.loaded.items():
+                self.loaded[name] = sprite.convert_alpha()
+
+
+def convert_assets(sprites: dict) -> dict:
+    "Converts sprites to the display's pixel format in place, does nothing until a display exists"
+    if pg.display.get_surface() is None:
+        return sprites
+    if isinstance(sprites, LazyAssets):
+        sprites.convertToDisplay()
+        return sprites
+    for name, sprite in sprites.items():
+        if isinstance(sprite, list):
+            sprites[name] = [image.convert_alpha() for image in sprite]
+        else:
+            sprites[name] = sprite.convert_alpha()
+    return sprites
+
+
+def load_assets(path, size: int = None, scale: float = None, getSubDirsAsList=False, scaleifsize=None, cache: AssetCache = None, masks: dict = None):
+    """cache -> AssetCache to read decoded and scaled sprites from\n
+    masks -> dictionary filled with each sprite's mask when cache is given"""
     sprites = {}
     for file in listdir(path):
         if getSubDirsAsList and isdir(join(path, file)):
@@ -43,6 +443,12 @@ def load_assets(path, size: int = None, scale: float = None, getSubDirsAsList=Fa
             continue
         elif not isfile(join(path, file)):
             continue
+        if cache is not None and not scaleifsize:
+            sprite, mask = cache.load(join(path, file), size, scale)
+            sprites[file.replace(".png", "")] = sprite
+            if masks is not None:
+                masks[file.replace(".png", "")] = mask
+            continue
         if size is None and scale is None:
             sprites[file.replace(".png", "")] = pg.image.load(join(path, file))
         elif scale is not None:
@@ -57,6 +463,8 @@ def load_assets(path, size: int = None, scale: float = None, getSubDirsAsList=Fa
             sprites[file.replace(".png", "")] = pg.transform.scale(
                 pg.image.load(join(path, file)), size
             )
+    if cache is not None:
+        cache.save()
     return sprites
 
 
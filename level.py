@@ -0,0 +1,308 @@
+"""Level Files For Pygame Games
+
+A level is a small JSON header followed by one NumPy record per object,
+grouped by spatial chunk, then the raw arrays of any tile chunks:
+
+    magic | version | header length | JSON header | object records | tile arrays
+
+Object classes are looked up by name in collision.objectMap. Integer data
+values are stored in record columns, anything else in the header's "extra" list."""
+import gc
+import json
+import struct
+
+import numpy as np
+
+from collision import objectMap
+from tiles import TileChunk, TileLayer
+
+magic = b"OLVL"
+version = 1
+prefix = struct.Struct("<4sHI")
+# data keys stored as record columns, the rest go in the header as JSON
+maxColumns = 8
+hasData, hasSpeed = 1, 2
+
+
+def recordType(columns: int) -> np.dtype:
+    return np.dtype([
+        ("type", "<u1"), ("name", "<u2"), ("flags", "<u1"), ("present", "<u1"),
+        ("x", "<i4"), ("y", "<i4"), ("width", "<i4"), ("height", "<i4"),
+        ("scale", "<f8"), ("angle", "<f8"), ("speed", "<f8"), ("extra", "<i4"),
+        ("columns", "<i8", (columns,)),
+    ])
+
+
+def isColumnValue(value) -> bool:
+    return type(value) is int and -2**63 <= value < 2**63
+
+
+# -----------Saving----------- #
+
+
+def save_level(path: str, objects, tiles: TileLayer = None, chunkSize: int = 512) -> int:
+    """Writes objects (tile chunks are skipped, pass their layer as tiles) and returns how many were saved\n
+    chunkSize -> pixels per spatial chunk records are grouped by for streaming loads"""
+    saved = [obj for obj in objects if not isinstance(obj, TileChunk)]
+    # plain dictionaries of every object's data, read once
+    datas = [None if obj.data is None else obj.data.copy() for obj in saved]
+    types, names, columns = [], [], []
+    typeIndex, nameIndex = {}, {}
+    for obj, data in zip(saved, datas):
+        typeName = type(obj).__name__
+        if objectMap.get(typeName) is not type(obj):
+            raise ValueError(f"{typeName} is not in objectMap")
+        if typeName not in typeIndex:
+            typeIndex[typeName] = len(types)
+            types.append(typeName)
+        if obj.name not in nameIndex:
+            nameIndex[obj.name] = len(names)
+            names.append(obj.name)
+        if data:
+            for key, value in data.items():
+                if isColumnValue(value) and key not in columns and len(columns) < maxColumns:
+                    columns.append(key)
+
+    # stable sort so objects keep their order within a chunk
+    keys = [(obj.rect.x // chunkSize, obj.rect.y // chunkSize) for obj in saved]
+    order = sorted(range(len(saved)), key=keys.__getitem__)
+    saved = [saved[index] for index in order]
+    datas = [datas[index] for index in order]
+    chunks = []
+    for index in order:
+        if chunks and chunks[-1][:2] == list(keys[index]):
+            chunks[-1][3] += 1
+        else:
+            chunks.append([*keys[index], chunks[-1][2] + chunks[-1][3] if chunks else 0, 1])
+
+    records = np.zeros(len(saved), recordType(len(columns)))
+    records["type"] = [typeIndex[type(obj).__name__] for obj in saved]
+    records["name"] = [nameIndex[obj.name] for obj in saved]
+    records["x"] = [obj.rect.x for obj in saved]
+    records["y"] = [obj.rect.y for obj in saved]
+    records["width"] = [obj.size[0] for obj in saved]
+    records["height"] = [obj.size[1] for obj in saved]
+    records["scale"] = [obj.scale for obj in saved]
+    records["angle"] = [obj.angle for obj in saved]
+    flags, speeds, present, values, extraIndices = [], [], [], [], []
+    extra = []
+    columnIndex = {key: index for index, key in enumerate(columns)}
+    for obj, data in zip(saved, datas):
+        flag, mask, row, extraIndex = 0, 0, [0] * len(columns), -1
+        speed = getattr(obj, "speed", None)
+        if speed is not None:
+            flag |= hasSpeed
+        if data is not None:
+            flag |= hasData
+            leftover = {}
+            for key, value in data.items():
+                column = columnIndex.get(key)
+                if column is not None and isColumnValue(value):
+                    mask |= 1 << column
+                    row[column] = value
+                else:
+                    leftover[key] = value
+            if leftover:
+                extraIndex = len(extra)
+                extra.append(leftover)
+        flags.append(flag)
+        speeds.append(0.0 if speed is None else speed)
+        present.append(mask)
+        values.append(row)
+        extraIndices.append(extraIndex)
+    records["flags"] = flags
+    records["speed"] = speeds
+    records["present"] = present
+    records["extra"] = extraIndices
+    if columns:
+        records["columns"] = values
+
+    header = {
+        "version": version,
+        "count": len(saved),
+        "types": types,
+        "names": names,
+        "columns": columns,
+        "extra": extra,
+        "chunkSize": chunkSize,
+        "chunks": chunks,
+    }
+    tileChunks = []
+    if tiles is not None:
+        tileChunks = [chunk for chunk in tiles.chunks.values() if chunk.count()]
+        header["tiles"] = {
+            "tileSize": tiles.tileSize,
+            "chunkTiles": tiles.chunkTiles,
+            "kinds": tiles.kinds[1:],
+            "chunks": [[chunk.column, chunk.row] for chunk in tileChunks],
+        }
+
+    headerBytes = json.dumps(header).encode()
+    with open(path, "wb") as file:
+        file.write(prefix.pack(magic, version, len(headerBytes)))
+        file.write(headerBytes)
+        file.write(records.tobytes())
+        for chunk in tileChunks:
+            file.write(chunk.occupancy.astype("<i2").tobytes())
+            file.write(chunk.health.astype("<i8").tobytes())
+    return len(saved)
+
+
+# -----------Loading----------- #
+
+
+class LevelReader:
+    """Reads a level a chunk at a time, objects sharing a class and look are
+    cloned from one constructed prototype instead of each being constructed"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as file:
+            fileMagic, fileVersion, headerLength = prefix.unpack(file.read(prefix.size))
+            if fileMagic != magic:
+                raise ValueError(f"{path} is not a level file")
+            if fileVersion > version:
+                raise ValueError(f"{path} is level version {fileVersion}, newer than {version}")
+            self.header = json.loads(file.read(headerLength))
+        self.dtype = recordType(len(self.header["columns"]))
+        self.recordsOffset = prefix.size + headerLength
+        self.tilesOffset = self.recordsOffset + self.header["count"] * self.dtype.itemsize
+        self.chunkSize = self.header["chunkSize"]
+        self.chunks = {(x, y): (start, count) for x, y, start, count in self.header["chunks"]}
+        self.classes = [objectMap[name] for name in self.header["types"]]
+        self.prototypes: dict[tuple, object] = {}
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def records(self, start: int, count: int) -> np.ndarray:
+        return np.fromfile(self.path, self.dtype, count, offset=self.recordsOffset + start * self.dtype.itemsize)
+
+    def prototype(self, typeIndex: int, nameIndex: int, width: int, height: int, scale: float, angle: float):
+        key = typeIndex, nameIndex, width, height, scale, angle
+        obj = self.prototypes.get(key)
+        if obj is None:
+            name = self.header["names"][nameIndex]
+            obj = self.prototypes[key] = self.classes[typeIndex](0, 0, name, scale, angle, (width, height))
+        return obj
+
+    def build(self, records: np.ndarray) -> list:
+        "Objects for a slice of records"
+        columns, extra = self.header["columns"], self.header["extra"]
+        everyColumn = (1 << len(columns)) - 1
+        fields = [records[name].tolist() for name in ("type", "name", "width", "height", "scale", "angle", "x", "y", "flags", "speed", "present", "extra")]
+        values = records["columns"].tolist()
+        objects = []
+        # collections only run between the many allocations here, not during them
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for (typeIndex, nameIndex, width, height, scale, angle, x, y, flags, speed, present, extraIndex), row in zip(zip(*fields), values):
+                data = None
+                if flags & hasData:
+                    if present == everyColumn:
+                        data = dict(zip(columns, row))
+                    else:
+                        data = {key: row[index] for index, key in enumerate(columns) if present >> index & 1}
+                    if extraIndex >= 0:
+                        data.update(extra[extraIndex])
+                obj = self.prototype(typeIndex, nameIndex, width, height, scale, angle).clone(x, y, data)
+                if flags & hasSpeed:
+                    obj.speed = speed
+                objects.append(obj)
+        finally:
+            if collecting:
+                gc.enable()
+        return objects
+
+    def readChunk(self, key: tuple[int, int]) -> list:
+        start, count = self.chunks[key]
+        return self.build(self.records(start, count))
+
+    def readAll(self) -> list:
+        return self.build(self.records(0, len(self)))
+
+    def iterChunks(self, around: tuple[int, int] = None):
+        """Yields (chunk, objects) for every chunk, nearest to the pixel position around first"""
+        keys = list(self.chunks)
+        if around is not None:
+            x, y = around[0] // self.chunkSize, around[1] // self.chunkSize
+            keys.sort(key=lambda key: max(abs(key[0] - x), abs(key[1] - y)))
+        for key in keys:
+            yield key, self.readChunk(key)
+
+    def loadTiles(self, layer: TileLayer) -> list[TileChunk]:
+        "Fills layer with the level's tiles and returns the chunks loaded"
+        tiles = self.header.get("tiles")
+        if tiles is None:
+            return []
+        if tiles["tileSize"] != layer.tileSize or tiles["chunkTiles"] != layer.chunkTiles:
+            raise ValueError("level tiles do not match the layer's tileSize and chunkTiles")
+        # kind ids in the file mapped onto the layer's
+        kinds = np.array([0] + [layer.kindId(name, scale) for name, scale in tiles["kinds"]], dtype=np.int16)
+        cells = layer.chunkTiles * layer.chunkTiles
+        size = len(tiles["chunks"]) * cells
+        with open(self.path, "rb") as file:
+            file.seek(self.tilesOffset)
+            data = file.read(size * 10)
+        loaded = []
+        offset = 0
+        shape = layer.chunkTiles, layer.chunkTiles
+        for column, row in tiles["chunks"]:
+            occupancy = np.frombuffer(data, "<i2", cells, offset).reshape(shape)
+            health = np.frombuffer(data, "<i8", cells, offset + cells * 2).reshape(shape)
+            offset += cells * 10
+            loaded.append(layer.loadChunk(column, row, kinds[occupancy], health))
+        return loaded
+
+
+def load_level(path: str, game, around: tuple[int, int] = None) -> int:
+    """Spawns a level's tiles and objects into game, chunks nearest around first, returns the objects spawned"""
+    reader = LevelReader(path)
+    for chunk in reader.loadTiles(game.tiles):
+        if chunk not in game.registry:
+            game.spawn(chunk)
+    count = 0
+    for _, objects in reader.iterChunks(around):
+        for obj in objects:
+            game.spawn(obj)
+        count += len(objects)
+    return count
+
+
+# -----------JSON----------- #
+
+
+def save_level_json(path: str, objects) -> None:
+    "Readable one dictionary per object export, slow for large levels"
+    entries = []
+    for obj in objects:
+        if isinstance(obj, TileChunk):
+            continue
+        entries.append({
+            "type": type(obj).__name__,
+            "name": obj.name,
+            "x": obj.rect.x,
+            "y": obj.rect.y,
+            "size": list(obj.size),
+            "scale": obj.scale,
+            "angle": obj.angle,
+            "speed": getattr(obj, "speed", None),
+            "data": obj.data if obj.data is None else dict(obj.data),
+        })
+    with open(path, "w") as file:
+        json.dump(entries, file)
+
+
+def load_level_json(path: str) -> list:
+    with open(path) as file:
+        entries = json.load(file)
+    objects = []
+    for entry in entries:
+        obj = objectMap[entry["type"]](entry["x"], entry["y"], entry["name"], entry["scale"], entry["angle"], entry["size"])
+        obj.rect.topleft = entry["x"], entry["y"]
+        obj.data = entry["data"]
+        if entry["speed"] is not None:
+            obj.speed = entry["speed"]
+        objects.append(obj)
+    return objects
@@ -1,12 +1,30 @@
 import pygame as pg
 from pygame.transform import scale
 
-from assets import blockSize
+from assets import assets, blockSize
 from collision import *
 from random import randint
-from functions import blit_text
+from functions import blit_text, convert_assets
 from time import time
 from GUI import Text
+from entities import EnemyStore, EntityRegistry, TickScheduler, update_enemies
+from rendering import Renderer, SpriteAtlas
+from tiles import Tile, TileChunk, TileLayer
+from streaming import WorldStreamer
+from level import load_level, save_level
+from parallel import RegionCollider
+from pathfinding import FlowField
+from profiler import FrameProfiler
+
+
+class ScriptedKeys:
+    "Stands in for pg.key.get_pressed()"
+
+    def __init__(self, pressed=()) -> None:
+        self.pressed = set(pressed)
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.pressed
 
 
 class Game:
@@ -16,42 +34,134 @@ class Game:
         name: str,
         fps: int = 60,
         background: tuple[int, int, int] = (255, 255, 255),
+        dirtyRendering: bool = False,
+        tickRate: int = None,
+        maxCatchUp: int = 5,
+        spriteAtlas: bool = False,
+        headless: bool = False,
+        placeholderSprites: bool = False,
     ):
+        """dirtyRendering -> only redraw and present the areas that changed,
+        display() must then draw through self.renderer\n
+        spriteAtlas -> draw small sprites from one shared atlas surface\n
+        placeholderSprites -> show sprites still loading as placeholders instead of waiting for them,
+        simulations stay deterministic only without them\n
+        headless -> no window or renderer, only simulate() can run the game,
+        no keys are held and the mouse stays in the middle of the screen\n
+        tickRate -> simulation steps per second, steps on a fixed timestep apart from the frame rate,
+        None steps once per frame\n
+        maxCatchUp -> most steps run in one frame before falling behind is dropped"""
         self.width, self.height = resolution
         self.name = name
-        self.window = pg.display.set_mode(resolution)
+        self.headless = headless
+        self.window, self.renderer = None, None
+        if not headless:
+            self.window = pg.display.set_mode(resolution)
+            pg.display.set_caption(name)
+            # blits skip per pixel format conversion once sprites match the display
+            convert_assets(assets)
+        transformCache.clear()
+        transformCache.placeholders = placeholderSprites and not headless
         self.fps = fps
         self.clock = pg.time.Clock()
         self.run = True
         self.background = background
-        pg.display.set_caption(name)
+        if not headless:
+            self.renderer = Renderer(self.window, background, dirtyRendering, SpriteAtlas() if spriteAtlas else None)
+        self.profiler = FrameProfiler()
 
         self.deltaTime = 0
+        # benchmarks run as fast as possible
+        self.capFrameRate = True
+
+        self.fixedTimestep = tickRate is not None
+        self.tickRate = tickRate or fps
+        self.stepTime = 1 / self.tickRate
+        self.maxCatchUp = maxCatchUp
+        self.accumulator = 0.0
+        # how far between the last two steps the frame is drawn
+        self.alpha = 1.0
 
     def tick(self) -> None:
-        self.deltaTime = self.clock.tick(self.fps) / 16
-        if self.deltaTime > 1.4:
+        elapsed = self.clock.tick(self.fps if self.capFrameRate else 0)
+        self.deltaTime = elapsed / 16
+        if self.deltaTime > 1.4 and self.capFrameRate:
             print("[Graphics] Low FPS")
+        if not self.fixedTimestep:
+            self.step()
+            return
+
+        self.accumulator += elapsed / 1000
+        steps = 0
+        while self.accumulator >= self.stepTime:
+            if steps == self.maxCatchUp:
+                # drop the backlog instead of spiralling further behind
+                self.accumulator = 0.0
+                break
+            self.step()
+            self.accumulator -= self.stepTime
+            steps += 1
+        self.alpha = self.accumulator / self.stepTime
+
+    def step(self) -> None:
+        "Advances the simulation by one tick"
+
+    def simulate(self, steps: int) -> None:
+        "Runs steps ticks without the clock or the display, for headless runs"
+        for _ in range(steps):
+            self.step()
+
+    # input is read through these so it can be scripted
+    def getPressed(self):
+        if self.headless:
+            return ScriptedKeys()
+        return pg.key.get_pressed()
+
+    def getMousePos(self) -> tuple[int, int]:
+        if self.headless:
+            return self.width // 2, self.height // 2
+        return pg.mouse.get_pos()
 
     def display(self) -> None: ...
 
     def event(self, event: pg.event.Event) -> None:
         if event.type == pg.QUIT:
             self.run = False
-        if event.type == pg.K_F3:
-            print(self.deltaTime)
+        if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+            self.profiler.toggleOverlay()
+        if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+            self.profiler.exportChromeTrace("frame_trace.json")
+            print("[Profiler] Wrote frame_trace.json")
 
     def quit(self):
         return None
 
     def start(self):
+        profiler = self.profiler
         while self.run:
-            for event in pg.event.get():
-                self.event(event)
-            self.tick()
-            self.window.fill(self.background)
-            self.display()
-            pg.display.update()
+            profiler.beginFrame()
+            with profiler.section("events"):
+                for event in pg.event.get():
+                    self.event(event)
+            with profiler.section("tick"):
+                self.tick()
+            with profiler.section("display"):
+                if profiler.showOverlay:
+                    # the overlay is drawn over whatever the renderer tracked
+                    self.renderer.invalidate()
+                if self.renderer.dirty:
+                    self.display()
+                else:
+                    self.window.fill(self.background)
+                    self.display()
+                if profiler.showOverlay:
+                    profiler.drawOverlay(self.window)
+            with profiler.section("present"):
+                if self.renderer.dirty:
+                    pg.display.update(self.renderer.dirtyRects)
+                else:
+                    pg.display.update()
+            profiler.endFrame()
         return self.quit()
 
 
@@ -62,15 +172,57 @@ class Outdoors(Game):
         name: str,
         fps: int = 60,
         background: tuple[int, int, int] = (255, 255, 255),
+        dirtyRendering: bool = False,
+        tickRate: int = None,
+        maxCatchUp: int = 5,
+        streamRadius: int = None,
+        spillRadius: int = None,
+        spriteAtlas: bool = False,
+        headless: bool = False,
+        collisionWorkers: int = None,
+        placeholderSprites: bool = False,
     ) -> None:
-        super().__init__(resolution, name, fps, background)
+        """streamRadius -> chunks around the camera that keep ticking, objects further away are packed,
+        None keeps everything active\n
+        spillRadius -> chunks beyond which packed objects are written to disk\n
+        collisionWorkers -> threads resolving movers region by region, None collides serially"""
+        super().__init__(resolution, name, fps, background, dirtyRendering, tickRate, maxCatchUp, spriteAtlas, headless, placeholderSprites)
+        assets.prefetch("player", "enemies", "world")
+        # sprites drawn from placeholders are rebuilt when this falls behind assets.version
+        self.assetVersion = assets.version
         self.player = CorePlayer(100, 100, "Player", scale=3, data={"Health": 10000})
-        self.objects = [
-            Enemy(300, 300, "Mog2129", scale=1.5, speed=3, data={"Health": 2000}),
-            Object(blockSize * 3, blockSize * 4, "Crate", scale=2, data={"Health": 2000}),
-        ]
+        # positions before the latest step, drawn between when interpolating
+        self.previousPositions = {}
+        self.registry = EntityRegistry()
+        self.objects = self.registry.objects
+        self.grid = SpatialHash(blockSize, self.registry.slotOf)
+        self.enemies = EnemyStore()
+        # enemies well off screen pick a direction every 4th tick
+        self.scheduler = TickScheduler(farDistance=blockSize * 16)
+        self.contacts = ContactEvents()
+        self.collider = None if collisionWorkers is None else RegionCollider(collisionWorkers)
+        # crates are static so they live in baked tile chunks instead of being objects
+        self.tiles = TileLayer(blockSize)
+        self.crate = self.tiles.addKind("Crate", scale=2)
+        self.flowField = FlowField(blockSize)
+        self.enemyPool = ObjectPool(Enemy, "Mog2129", scale=1.5, speed=3)
+        self.spawn(self.enemyPool.acquire(300, 300, {"Health": 2000}))
+        self.placeTile(blockSize * 3, blockSize * 4, self.crate, 2000)
         self.x_offset, self.y_offset = 0, 0
-        self.healthCountText = Text(f"Health {self.player.data["Health"]}", 0, 0, (0, 0, 0), 35, "Arialblack")
+        self.lastOffset = self.x_offset, self.y_offset
+        self.streamer = None
+        if streamRadius is not None:
+            self.streamer = WorldStreamer(self, blockSize * 8, streamRadius, spillRadius)
+        self.healthCountText = None
+        if not headless:
+            self.healthCountText = Text(f"Health {self.player.health}", 0, 0, (0, 0, 0), 35, "Arialblack")
+
+    def quit(self):
+        if self.streamer is not None:
+            self.streamer.close()
+        if self.collider is not None:
+            self.collider.close()
+        return super().quit()
 
     def event(self, event: pg.event.Event) -> None:
         super().event(event)
@@ -78,52 +230,214 @@ class Outdoors(Game):
             self.mouseDown(event)
         self.player.eventControls(event)
 
+    def spawn(self, obj: CoreObject) -> CoreObject:
+        self.registry.spawn(obj)
+        self.grid.insert(obj)
+        # a recycled object must not be drawn from where it was last used
+        self.previousPositions.pop(obj, None)
+        if sweepResponse(obj) == "solid":
+            self.flowField.invalidate()
+        if isinstance(obj, Enemy):
+            self.enemies.add(obj)
+        self.scheduler.add(obj)
+        return obj
+
+    def despawn(self, obj: CoreObject | Tile) -> None:
+        "Removed at the end of the tick"
+        if isinstance(obj, Tile):
+            self.tiles.despawn(obj)
+        else:
+            self.registry.despawn(obj)
+
+    def placeTile(self, x: int, y: int, kind: int, health: int = 0) -> None:
+        "Fills the tile under x, y, drawn and collided from the next bakeTiles"
+        chunk = self.tiles.place(*self.tiles.cellAt(x, y), kind, health)
+        if chunk not in self.registry:
+            self.spawn(chunk)
+
+    def bakeTiles(self) -> None:
+        "Redraws changed tile chunks, empty ones are despawned"
+        for chunk in self.tiles.bake():
+            if chunk.mask is None:
+                self.registry.despawn(chunk)
+            else:
+                self.grid.update(chunk)
+
+    def flushDespawns(self, recycle: bool = True) -> None:
+        """recycle -> return pooled objects to their pool, False when they are only
+        being taken out of the world for a while"""
+        self.tiles.flush()
+        self.bakeTiles()
+        for obj in self.registry.flush():
+            self.grid.remove(obj)
+            if sweepResponse(obj) == "solid":
+                self.flowField.invalidate()
+            if isinstance(obj, Enemy):
+                self.enemies.remove(obj)
+            self.scheduler.remove(obj)
+            if recycle and obj.pool is not None:
+                obj.pool.release(obj)
+
+    def clearWorld(self) -> None:
+        "Despawns every object and tile"
+        for obj in self.objects:
+            self.despawn(obj)
+        self.flushDespawns()
+        self.contacts.clear()
+        kinds = self.tiles.kinds
+        self.tiles = TileLayer(blockSize)
+        self.tiles.kinds = kinds
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer.parked.clear()
+
+    def saveLevel(self, path: str) -> int:
+        "Saves the active objects and tiles, returns the number of objects saved"
+        return save_level(path, self.objects, self.tiles, self.streamer.chunkSize if self.streamer else 512)
+
+    def loadLevel(self, path: str) -> int:
+        "Replaces the world with a saved level, returns the number of objects loaded"
+        self.clearWorld()
+        count = load_level(path, self, self.camera().center)
+        self.bakeTiles()
+        return count
+
     def mouseDown(self, event):
-        mouseX, mouseY = pg.mouse.get_pos()
-        self.objects.append(
-            Object(
-                mouseX - (mouseX % blockSize),
-                mouseY - (mouseY % blockSize),
-                "Crate",
-                scale=2,
-                data={"Health": 2000}
-            )
-        )
+        mouseX, mouseY = self.getMousePos()
+        self.placeTile(mouseX + self.x_offset, mouseY + self.y_offset, self.crate, 2000)
 
-    def tick(self) -> None:
-        super().tick()
+    def reloadSprites(self) -> None:
+        "Rebuilds every active object's surfaces and masks, once sprites drawn as placeholders have loaded"
+        self.assetVersion = assets.version
+        self.player.reload()
+        self.enemyPool.template.reload()
+        self.tiles.reload()
+        for obj in self.objects:
+            if not isinstance(obj, TileChunk):
+                obj.reload()
+        self.renderer.invalidate()
+
+    def step(self) -> None:
+        profiler = self.profiler
+        if transformCache.placeholders and self.assetVersion != assets.version:
+            self.reloadSprites()
+        # tiles placed by events since the last step
+        self.bakeTiles()
+        if self.fixedTimestep:
+            # static objects never move and are drawn at their rect without an entry, only the
+            # scheduler's entities and what the player can push this step are recorded
+            player = self.player
+            nearby = self.grid.query(player.rect.inflate(blockSize, blockSize))
+            self.previousPositions = {obj: obj.rect.topleft for obj in self.scheduler.entities}
+            self.previousPositions.update((obj, obj.rect.topleft) for obj in nearby)
+            self.previousPositions[player] = player.rect.topleft
 
-        self.player.script(self)
-        collisions = self.player.collide(self.objects)
-        for collision in collisions:
-            if collision.type == "Enemy":
-                self.player.data["Health"] -= 1
-                self.healthCountText.text = f"Health {self.player.data["Health"]}"
-                self.healthCountText.reload()
+        with profiler.section("script"):
+            self.player.script(self)
+        with profiler.section("collide"):
+            self.player.collide(self.objects, self.grid, self.contacts)
 
+        with profiler.section("path"):
+            self.flowField.update(self)
+        self.scheduler.begin(self)
+        with profiler.section("script"):
+            update_enemies(self)
+            awake = self.scheduler.awake()
+            for obj in self.scheduler.due(self, awake):
+                obj.script(self)
 
         # object collision
-        for obj in self.objects:
-            obj.script(self)
-            collisions = obj.collide(self.objects)
+        with profiler.section("collide"):
+            # objects with an empty collisionMask never move into anything
+            movers = [obj for obj in awake if obj.collisionMask]
+            collisionStats.skippedCalls += len(self.objects) - len(movers)
+            if self.collider is None:
+                for obj in movers:
+                    collisions = obj.collide(self.objects, self.grid, self.contacts)
+                    self.scheduler.settle(obj, bool(collisions))
+            else:
+                # contacts are reported in mover order whichever thread found them
+                for obj, collisions in zip(movers, self.collider.collide(movers, self.objects, self.grid)):
+                    for collision in collisions:
+                        self.contacts.report(obj, collision)
+                    self.scheduler.settle(obj, bool(collisions))
+            self.contacts.flush()
+            self.applyContacts()
+
+        with profiler.section("spawn"):
+            if randint(0, self.tickRate*4) == 0:
+                self.spawn(self.enemyPool.acquire(300, 300, {"Health": 2000}))
+
+            self.flushDespawns()
+
+        if self.streamer is not None:
+            with profiler.section("stream"):
+                self.streamer.update()
 
+    def applyContacts(self) -> None:
+        "Health loss and block breaking, once per touching pair per step"
+        player = self.player
+        playerHit = False
+        for kind, obj, other in self.contacts:
+            if kind == contactEnd:
+                continue
+            if obj is player:
+                if other.type == "Enemy":
+                    player.health -= 1
+                    playerHit = True
             # enemy block breaking
-            if obj.type == "Enemy":
-                for collision in collisions:
-                    collision.data["Health"] -= 1
-                    if collision.data["Health"] < 1:
-                        for obj in self.objects:
-                            if id(obj) == id(collision):
-                                self.objects.remove(obj)
+            elif obj.type == "Enemy":
+                other.health -= 1
+                if other.health < 1:
+                    self.despawn(other)
+        if playerHit and self.healthCountText is not None:
+            self.healthCountText.text = f"Health {player.health}"
+            self.healthCountText.reload()
 
-        if randint(0, self.fps*4) == 0:
-            self.objects.append(Enemy(300, 300, "Mog2129", scale=1.5, speed=3, data={"Health": 2000}))
+    def camera(self) -> pg.Rect:
+        return pg.Rect(self.x_offset, self.y_offset, self.width, self.height)
+
+    def visibleObjects(self) -> list[CoreObject]:
+        "Objects on screen, in draw order"
+        camera = self.camera()
+        return [obj for obj in self.grid.query(camera) if obj.rotatedImage is not None and camera.colliderect(obj.rect)]
+
+    def screenPosition(self, obj: CoreObject) -> tuple[int, int]:
+        "Where obj is drawn, between its last two steps on a fixed timestep"
+        x, y = obj.rect.topleft
+        previous = self.previousPositions.get(obj) if self.fixedTimestep else None
+        if previous is not None:
+            x = round(previous[0] + (x - previous[0]) * self.alpha)
+            y = round(previous[1] + (y - previous[1]) * self.alpha)
+        return x - self.x_offset, y - self.y_offset
+
+    def drawItems(self) -> list[tuple]:
+        "(key, surface, screen rect) for everything on screen"
+        items = []
+        append = items.append
+        x_offset, y_offset = self.x_offset, self.y_offset
+        previousPositions = self.previousPositions if self.fixedTimestep else {}
+        for obj in self.visibleObjects():
+            rect = obj.rect
+            previous = previousPositions.get(obj)
+            if previous is None or previous == rect.topleft:
+                # objects other than the player are the size of their image
+                append((obj, obj.rotatedImage, rect.move(-x_offset, -y_offset)))
+            else:
+                append((obj, obj.rotatedImage, pg.Rect(self.screenPosition(obj), rect.size)))
+        image = self.player.rotatedImage
+        append((self.player, image, pg.Rect(self.screenPosition(self.player), image.get_size())))
+        items.append((self.healthCountText, self.healthCountText.image, self.healthCountText.rect))
+        return items
 
     def display(self) -> None:
-        [obj.display(self.window, self.x_offset, self.y_offset) for obj in self.objects]
-        self.player.display(self.window, self.x_offset, self.y_offset)
-        self.healthCountText.display(self.window)
+        if self.lastOffset != (self.x_offset, self.y_offset):
+            self.lastOffset = self.x_offset, self.y_offset
+            self.renderer.invalidate()
+        self.renderer.draw(self.drawItems())
+
 
+if __name__ == "__main__":
+    instance = Outdoors((900, 500), "Outdoors", fps=60, tickRate=60, streamRadius=2, spillRadius=6, placeholderSprites=True)
+    instance.start()
 
-instance = Outdoors((900, 500), "Outdoors", fps=60)
-instance.start()
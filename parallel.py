@@ -0,0 +1,77 @@
+"""Region Parallel Collision For Pygame Games"""
+from concurrent.futures import ThreadPoolExecutor
+
+from collision import sweepResponse
+
+
+class RegionCollider:
+    """Runs collide() for a tick's movers on a thread pool, one task per spatial region.\n
+    A mover can go to the pool when nothing else moving collides with it and no object it can
+    touch reacts to being touched (sweepResponse None, such as PushableObject) near its region.
+    It then only meets objects that stay put for the whole phase, so its result does not depend
+    on the order movers run in. Every other mover runs serially afterwards. Grid updates are
+    applied in the original mover order, so results match calling collide() serially.
+    collisionStats counters may undercount while the pool runs.\n
+    workers -> threads in the pool\n
+    regionSize -> pixels along each side of a region\n
+    margin -> pixels around a region's movement checked for reacting objects, covers pushback"""
+
+    def __init__(self, workers: int = 4, regionSize: int = 512, margin: int = 64) -> None:
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="collide")
+        self.regionSize = regionSize
+        self.margin = margin
+        # movers run on the pool and serially last tick
+        self.parallelMovers, self.serialMovers = 0, 0
+
+    def regions(self, movers: list) -> dict[tuple[int, int], list[int]]:
+        "Indices into movers grouped by the region holding each mover's centre"
+        size = self.regionSize
+        regions: dict[tuple[int, int], list[int]] = {}
+        for index, obj in enumerate(movers):
+            x, y = obj.rect.center
+            regions.setdefault((x // size, y // size), []).append(index)
+        return regions
+
+    def isolated(self, movers: list, indices: list[int], grid) -> bool:
+        "Whether every object the movers at indices can reach this tick stays put when touched"
+        area = movers[indices[0]].sweptBounds().unionall([movers[index].sweptBounds() for index in indices[1:]])
+        area.inflate_ip(self.margin * 2, self.margin * 2)
+        mask = 0
+        for index in indices:
+            mask |= movers[index].collisionMask
+        return not any(sweepResponse(obj) is None and obj.collisionLayer & mask for obj in grid.query(area))
+
+    def collide(self, movers: list, objects: list, grid) -> list[list]:
+        "collide() for every mover, returns what each one touched in the same order as movers"
+        results: list[list] = [None] * len(movers)
+        masks = 0
+        for obj in movers:
+            masks |= obj.collisionMask
+
+        def run(indices: list[int]) -> None:
+            for index in indices:
+                results[index] = movers[index].collide(objects, grid, updateGrid=False)
+
+        parallel, serial = [], []
+        for indices in self.regions(movers).values():
+            independent = [index for index in indices if not movers[index].collisionLayer & masks]
+            if independent and self.isolated(movers, independent, grid):
+                parallel.append(independent)
+                serial.extend(index for index in indices if movers[index].collisionLayer & masks)
+            else:
+                serial.extend(indices)
+        serial.sort()
+        # pooled movers leave the grid alone until every task is done
+        list(self.pool.map(run, parallel))
+        for indices in parallel:
+            for index in indices:
+                grid.update(movers[index])
+        for index in serial:
+            results[index] = movers[index].collide(objects, grid)
+
+        self.parallelMovers = len(movers) - len(serial)
+        self.serialMovers = len(serial)
+        return results
+
+    def close(self) -> None:
+        self.pool.shutdown()
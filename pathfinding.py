@@ -0,0 +1,146 @@
+"""Flow Field Pathfinding For Pygame Games"""
+import numpy as np
+import pygame as pg
+
+from collision import sweepResponse
+
+# neighbour offsets (dx, dy), straight ones first so they win ties
+offsets = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+unreached = np.iinfo(np.int32).max
+
+
+def shifted(array: np.ndarray, dx: int, dy: int, fill) -> np.ndarray:
+    "array[y + dy, x + dx] at every x, y, fill where that is outside"
+    result = np.full_like(array, fill)
+    height, width = array.shape
+    result[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)] = \
+        array[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)]
+    return result
+
+
+def coveredCells(rect: pg.Rect, cellSize: int) -> list[tuple[int, int]]:
+    "Cells an obstacle blocks, those whose centre it covers and the one holding its own centre"
+    half = cellSize // 2
+    cells = {(rect.centerx // cellSize, rect.centery // cellSize)}
+    for column in range((rect.left - half) // cellSize + 1, (rect.right - half - 1) // cellSize + 1):
+        for row in range((rect.top - half) // cellSize + 1, (rect.bottom - half - 1) // cellSize + 1):
+            cells.add((column, row))
+    return list(cells)
+
+
+class FlowField:
+    """Distances from the player's cell over a window of cells around it, found with one
+    breadth first search, and the neighbour to head for from every cell.\n
+    Rebuilt only when the player changes cell or the obstacles change, so each
+    enemy's direction is an array lookup however many enemies there are.\n
+    cellSize -> pixels per cell, blockSize so crates fill whole cells\n
+    radius -> cells searched around the player, enemies further away chase directly"""
+
+    def __init__(self, cellSize: int, radius: int = 24) -> None:
+        self.cellSize = cellSize
+        self.radius = radius
+        size = radius * 2 + 1
+        # (column, row) of the window's top left cell
+        self.origin = (0, 0)
+        self.goal: tuple[int, int] = None
+        self.distance = np.full((size, size), unreached, dtype=np.int32)
+        self.step = np.zeros((size, size, 2), dtype=np.int8)
+        self.hasStep = np.zeros((size, size), dtype=bool)
+        self.obstacleKey = None
+        self.solidVersion = 0
+        self.rebuilds = 0
+
+    def invalidate(self) -> None:
+        "Call when solid objects are added or removed"
+        self.solidVersion += 1
+
+    def update(self, game) -> bool:
+        "Rebuilds the field if the player moved cell or the obstacles changed, returns whether it did"
+        center = game.player.rect.center
+        goal = center[0] // self.cellSize, center[1] // self.cellSize
+        obstacleKey = id(game.tiles), game.tiles.version, self.solidVersion
+        if goal == self.goal and obstacleKey == self.obstacleKey:
+            return False
+        self.goal, self.obstacleKey = goal, obstacleKey
+        self.origin = goal[0] - self.radius, goal[1] - self.radius
+        self.build(self.blocked(game))
+        self.rebuilds += 1
+        return True
+
+    def blocked(self, game) -> np.ndarray:
+        "Cells of the window holding tiles or solid objects"
+        size = self.radius * 2 + 1
+        left, top = self.origin
+        blocked = np.zeros((size, size), dtype=bool)
+        window = pg.Rect(left * self.cellSize, top * self.cellSize, size * self.cellSize, size * self.cellSize)
+
+        tiles = game.tiles
+        chunkTiles = tiles.chunkTiles
+        for chunk in list(tiles.chunks.values()):
+            # chunk cells overlapping the window, in window coordinates
+            chunkLeft, chunkTop = chunk.column * chunkTiles - left, chunk.row * chunkTiles - top
+            x0, y0 = max(0, chunkLeft), max(0, chunkTop)
+            x1, y1 = min(size, chunkLeft + chunkTiles), min(size, chunkTop + chunkTiles)
+            if x0 < x1 and y0 < y1:
+                blocked[y0:y1, x0:x1] |= chunk.occupancy[y0 - chunkTop:y1 - chunkTop, x0 - chunkLeft:x1 - chunkLeft] != 0
+
+        for obj in game.grid.query(window):
+            if sweepResponse(obj) != "solid":
+                continue
+            for column, row in coveredCells(obj.rect, self.cellSize):
+                if 0 <= column - left < size and 0 <= row - top < size:
+                    blocked[row - top, column - left] = True
+        return blocked
+
+    def build(self, blocked: np.ndarray) -> None:
+        size = self.radius * 2 + 1
+        distance = np.full((size, size), unreached, dtype=np.int32)
+        free = ~blocked
+        # the player's own cell is always a valid goal
+        frontier = np.zeros((size, size), dtype=bool)
+        frontier[self.radius, self.radius] = True
+        free[self.radius, self.radius] = True
+        visited = frontier.copy()
+        level = 0
+        while frontier.any():
+            distance[frontier] = level
+            level += 1
+            grown = shifted(frontier, 1, 0, False) | shifted(frontier, -1, 0, False) | shifted(frontier, 0, 1, False) | shifted(frontier, 0, -1, False)
+            frontier = grown & free & ~visited
+            visited |= frontier
+
+        # cheapest neighbour of every cell, diagonals only when both sides are open
+        candidates = []
+        for dx, dy in offsets:
+            neighbour = shifted(distance, dx, dy, unreached)
+            if dx and dy:
+                passable = shifted(free, dx, 0, False) & shifted(free, 0, dy, False)
+                neighbour = np.where(passable, neighbour, unreached)
+            candidates.append(neighbour)
+        candidates = np.stack(candidates)
+        best = candidates.argmin(axis=0)
+        bestDistance = np.take_along_axis(candidates, best[None], axis=0)[0]
+        steps = np.array(offsets, dtype=np.int8)
+        self.step = steps[best]
+        # blocked cells still point out so enemies pushed into them find their way back
+        self.hasStep = (bestDistance < distance) | ((distance == unreached) & (bestDistance != unreached))
+        self.hasStep[self.radius, self.radius] = False
+        self.distance = distance
+
+    def waypoints(self, centers: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Centre of the next cell towards the player for each (x, y) in centers,
+        and whether there is one (False in the player's cell and outside the field)"""
+        cells = np.floor_divide(centers, self.cellSize).astype(np.int64)
+        local = cells - self.origin
+        size = self.radius * 2 + 1
+        inside = ((local >= 0) & (local < size)).all(axis=1)
+        local = np.clip(local, 0, size - 1)
+        valid = inside & self.hasStep[local[:, 1], local[:, 0]]
+        step = self.step[local[:, 1], local[:, 0]]
+        return (cells + step) * self.cellSize + self.cellSize // 2, valid
+
+    def waypoint(self, x: int, y: int) -> tuple[int, int] | None:
+        waypoints, valid = self.waypoints(np.array([[x, y]]))
+        if not valid[0]:
+            return None
+        return tuple(waypoints[0].tolist())
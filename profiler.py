@@ -0,0 +1,138 @@
+"""Frame Profiler For Pygame Games"""
+import json
+from collections import deque
+from time import perf_counter
+
+import pygame as pg
+
+from collision import collisionStats
+from functions import blit_text
+
+
+class Section:
+    "Times a with block into the current frame"
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "FrameProfiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *args) -> None:
+        self.profiler.record(self.name, self.start, perf_counter())
+
+
+class FrameProfiler:
+    """Per phase frame timings, mask test counts and a rolling frame time histogram.\n
+    history -> frames kept for averages, the histogram and the trace export\n
+    buckets -> upper bounds in milliseconds of the histogram's bins"""
+
+    def __init__(self, history: int = 300, buckets: tuple[float, ...] = (4, 8, 16.7, 33.3, 50)) -> None:
+        self.buckets = buckets
+        self.frames: deque[dict] = deque(maxlen=history)
+        self.trace: deque[list] = deque(maxlen=history)
+        self.sections: dict[str, Section] = {}
+        self.showOverlay = False
+        self.origin = perf_counter()
+        self.frame: dict = None
+        self.events: list = []
+        self.frameStart = 0.0
+        self.maskTests = 0
+
+    def beginFrame(self) -> None:
+        self.frame = {}
+        self.events = []
+        self.frameStart = perf_counter()
+        self.maskTests = collisionStats.maskTests
+
+    def endFrame(self) -> None:
+        end = perf_counter()
+        self.record("frame", self.frameStart, end)
+        self.frame["maskTests"] = collisionStats.maskTests - self.maskTests
+        self.frames.append(self.frame)
+        self.trace.append(self.events)
+
+    def reset(self) -> None:
+        "Forgets every recorded frame"
+        self.frames.clear()
+        self.trace.clear()
+
+    def section(self, name: str) -> Section:
+        "with profiler.section(name): adds the block's time to name for this frame"
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+        return section
+
+    def record(self, name: str, start: float, end: float) -> None:
+        if self.frame is None:
+            return
+        self.frame[name] = self.frame.get(name, 0.0) + (end - start) * 1000
+        self.events.append((name, start, end))
+
+    def averages(self) -> dict[str, float]:
+        "Mean milliseconds (or count) per frame of every section over the history"
+        totals: dict[str, float] = {}
+        for frame in self.frames:
+            for name, value in frame.items():
+                totals[name] = totals.get(name, 0.0) + value
+        return {name: total / len(self.frames) for name, total in totals.items()}
+
+    def histogram(self) -> list[int]:
+        "Frame counts per bucket, the last bin holds frames slower than every bound"
+        counts = [0] * (len(self.buckets) + 1)
+        for frame in self.frames:
+            milliseconds = frame["frame"]
+            for index, bound in enumerate(self.buckets):
+                if milliseconds <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def worstFrame(self) -> float:
+        return max((frame["frame"] for frame in self.frames), default=0.0)
+
+    def toggleOverlay(self) -> None:
+        self.showOverlay = not self.showOverlay
+
+    def drawOverlay(self, window: pg.Surface, colour=(0, 0, 0), size: int = 14) -> pg.Rect:
+        "Draws the averages and histogram in the top right corner, returns the area drawn"
+        averages = self.averages()
+        lines = [f"{name} {value:.2f}ms" for name, value in averages.items() if name != "maskTests"]
+        lines.append(f"mask tests {averages.get('maskTests', 0):.0f}")
+        lines.append(f"worst {self.worstFrame():.1f}ms")
+        bounds = [f"<{bound:g}" for bound in self.buckets] + [f">{self.buckets[-1]:g}"]
+        lines.append(" ".join(f"{bound}:{count}" for bound, count in zip(bounds, self.histogram())))
+
+        surfaces = [blit_text(window, line, (0, 0), colour, size, blit=False, cache=True) for line in lines]
+        width = max(surface.get_width() for surface in surfaces) + 8
+        height = sum(surface.get_height() for surface in surfaces) + 8
+        area = pg.Rect(window.get_width() - width, 0, width, height)
+        window.fill((255, 255, 255), area)
+        y = 4
+        for surface in surfaces:
+            window.blit(surface, (area.x + 4, y))
+            y += surface.get_height()
+        return area
+
+    def exportChromeTrace(self, path: str) -> None:
+        "Writes the recorded frames as Chrome trace event JSON, open it in chrome://tracing or Perfetto"
+        traceEvents = []
+        for frame, events in zip(self.frames, self.trace):
+            for name, start, end in events:
+                traceEvents.append({
+                    "name": name, "ph": "X", "pid": 0, "tid": 0,
+                    "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6,
+                })
+            if events:
+                traceEvents.append({
+                    "name": "maskTests", "ph": "C", "pid": 0, "tid": 0,
+                    "ts": (events[-1][2] - self.origin) * 1e6, "args": {"maskTests": frame["maskTests"]},
+                })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms"}, file)
@@ -0,0 +1,156 @@
+"""Rendering Module For Pygame Games"""
+from weakref import WeakKeyDictionary
+
+import pygame as pg
+
+
+def mergeRects(rects: list[pg.Rect]) -> list[pg.Rect]:
+    "Unions overlapping rects until none overlap"
+    merged: list[pg.Rect] = []
+    for rect in rects:
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+class SpriteAtlas:
+    """Small surfaces copied into one shared surface, so a batch of blits reads from a single source.\n
+    size -> (width, height) of the atlas surface\n
+    maxSprite -> surfaces longer than this on either side are left out\n
+    Surfaces are packed in rows the first time they are drawn, once full the rest draw from their own surface
+    until a packed surface is freed, the atlas is then cleared at the start of the next batch."""
+
+    def __init__(self, size: tuple[int, int] = (1024, 1024), maxSprite: int = 128) -> None:
+        self.surface = pg.Surface(size, pg.SRCALPHA)
+        if pg.display.get_surface() is not None:
+            self.surface = self.surface.convert_alpha()
+        self.surface.fill((0, 0, 0, 0))
+        self.maxSprite = maxSprite
+        # weak so the atlas never keeps surfaces alive, such as ones evicted from transformCache
+        self.areas: WeakKeyDictionary[pg.Surface, pg.Rect] = WeakKeyDictionary()
+        # surfaces packed since the last clear, freed ones drop out of areas
+        self.packed = 0
+        # top left of the next free spot and the height of the row it is in
+        self.x, self.y, self.rowHeight = 0, 0, 0
+        self.full = False
+        # set once full with freed space, areas handed out this frame must stay valid until the next batch
+        self.needsReset = False
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def area(self, surface: pg.Surface) -> pg.Rect | None:
+        "Where surface is in the atlas, packing it in when new, None when it is too big or does not fit"
+        area = self.areas.get(surface)
+        if area is not None:
+            return area
+        if self.full:
+            # space left by freed surfaces can only be reused by packing again from empty
+            self.needsReset = len(self.areas) < self.packed
+            return None
+        width, height = surface.get_size()
+        if width > self.maxSprite or height > self.maxSprite:
+            return None
+        atlasWidth, atlasHeight = self.surface.get_size()
+        if self.x + width > atlasWidth:
+            self.x, self.y, self.rowHeight = 0, self.y + self.rowHeight, 0
+        if self.y + height > atlasHeight:
+            self.full = True
+            return None
+        area = self.areas[surface] = pg.Rect(self.x, self.y, width, height)
+        # max against the cleared atlas copies pixels exactly instead of blending them
+        self.surface.blit(surface, area, special_flags=pg.BLEND_RGBA_MAX)
+        self.packed += 1
+        self.x += width
+        self.rowHeight = max(self.rowHeight, height)
+        return area
+
+    def clear(self) -> None:
+        self.surface.fill((0, 0, 0, 0))
+        self.areas.clear()
+        self.packed = 0
+        self.x, self.y, self.rowHeight = 0, 0, 0
+        self.full = False
+        self.needsReset = False
+
+
+class Renderer:
+    """Draws (key, surface, rect) items, rect being the on screen area of surface.\n
+    dirty -> when True only areas that changed since the last frame are cleared and redrawn,
+    dirtyRects then holds the areas to pass to pg.display.update\n
+    atlas -> SpriteAtlas small surfaces are drawn from, None draws every surface itself"""
+
+    def __init__(self, window: pg.Surface, background: tuple[int, int, int], dirty: bool = False, atlas: SpriteAtlas = None) -> None:
+        self.window = window
+        self.background = background
+        self.dirty = dirty
+        self.atlas = atlas
+        self.previous: dict = {}
+        self.dirtyRects: list[pg.Rect] = []
+        self.redrawAll = True
+
+    def setDirty(self, dirty: bool) -> None:
+        self.dirty = dirty
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        "Redraws the whole window next frame, call when the camera moves"
+        self.redrawAll = True
+
+    def batch(self, items: list[tuple]) -> list[tuple]:
+        "Surface.blits sequence for items, surfaces packed in the atlas are drawn from it"
+        if self.atlas is None:
+            return [(surface, rect) for _, surface, rect in items]
+        if self.atlas.needsReset:
+            self.atlas.clear()
+        atlasSurface, area = self.atlas.surface, self.atlas.area
+        batch = []
+        for _, surface, rect in items:
+            surfaceArea = area(surface)
+            batch.append((surface, rect) if surfaceArea is None else (atlasSurface, rect, surfaceArea))
+        return batch
+
+    def draw(self, items: list[tuple]) -> None:
+        window = self.window
+        if not self.dirty:
+            # the window has already been filled by Game.start
+            window.blits(self.batch(items), False)
+            return
+
+        current = {key: (surface, rect) for key, surface, rect in items}
+        if self.redrawAll:
+            window.fill(self.background)
+            window.blits(self.batch(items), False)
+            self.dirtyRects = [window.get_rect()]
+            self.previous = current
+            self.redrawAll = False
+            return
+
+        changed = []
+        previous = self.previous
+        for key, (surface, rect) in current.items():
+            old = previous.pop(key, None)
+            if old is None:
+                changed.append(rect)
+            elif old[0] is not surface or old[1] != rect:
+                changed.append(old[1])
+                changed.append(rect)
+        # whatever is left disappeared this frame
+        changed.extend(rect for _, rect in previous.values())
+        self.previous = current
+
+        screen = window.get_rect()
+        self.dirtyRects = [rect.clip(screen) for rect in mergeRects(changed) if rect.colliderect(screen)]
+        if not self.dirtyRects:
+            return
+        itemRects = [rect for _, _, rect in items]
+        batch = self.batch(items)
+        for dirtyRect in self.dirtyRects:
+            window.set_clip(dirtyRect)
+            window.fill(self.background, dirtyRect)
+            window.blits([batch[index] for index in dirtyRect.collidelistall(itemRects)], False)
+        window.set_clip(None)
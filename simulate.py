@@ -0,0 +1,102 @@
+"""Headless Batch Simulation For The Outdoors Game
+
+python simulate.py [--worlds N] [--ticks N] [--workers N] [--scenario NAME] [--seed N] [--output results.json]
+
+Steps many independent Outdoors worlds without a window, one world per task in a
+ProcessPoolExecutor. World i is seeded with seed + i, so a batch gives the same
+results however many workers run it. Prints each world's stats and the batch's
+aggregate, for balancing and AI testing."""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from time import perf_counter
+
+from bench import ScriptedOutdoors, scenarios
+from collision import collisionStats, contactBegin
+
+
+def run_world(scenario: str, ticks: int, seed: int) -> dict:
+    "Runs one headless world, the unit of work sent to each process"
+    setup, script = scenarios[scenario]
+    random.seed(seed)
+    collisionStats.reset()
+    game = ScriptedOutdoors(script, (900, 500), f"{scenario} {seed}", headless=True)
+    setup(game, random.Random(seed))
+
+    contactBegins = 0
+    start = perf_counter()
+    for _ in range(ticks):
+        game.step()
+        contactBegins += sum(1 for kind, _, _ in game.contacts if kind == contactBegin)
+    seconds = perf_counter() - start
+    return {
+        "scenario": scenario,
+        "seed": seed,
+        "ticks": ticks,
+        "seconds": seconds,
+        "playerHealth": game.player.health,
+        "enemies": len(game.enemies),
+        "objects": len(game.objects),
+        "tiles": len(game.tiles),
+        "contactBegins": contactBegins,
+        "maskTests": collisionStats.maskTests,
+    }
+
+
+def run_worlds(scenario: str, worlds: int, ticks: int, seed: int = 0, workers: int = None) -> list[dict]:
+    """Runs worlds seeded seed, seed + 1, ... and returns their stats in seed order\n
+    workers -> processes to spread the worlds over, None for one per core, 1 runs them in this process"""
+    seeds = range(seed, seed + worlds)
+    if workers == 1:
+        return [run_world(scenario, ticks, worldSeed) for worldSeed in seeds]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_world, repeat(scenario), repeat(ticks), seeds))
+
+
+def aggregate(results: list[dict]) -> dict:
+    "Mean, min and max of every numeric stat across worlds"
+    summary = {"worlds": len(results), "ticks": sum(result["ticks"] for result in results)}
+    for key, value in results[0].items():
+        if key in ("seed", "ticks") or not isinstance(value, (int, float)):
+            continue
+        values = [result[key] for result in results]
+        summary[key] = {"mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def main(arguments=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--worlds", type=int, default=8)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--workers", type=int, help="processes, defaults to one per core")
+    parser.add_argument("--scenario", default="enemiesVsCrates", choices=sorted(scenarios))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write every world's stats and the aggregate as JSON")
+    options = parser.parse_args(arguments)
+
+    start = perf_counter()
+    results = run_worlds(options.scenario, options.worlds, options.ticks, options.seed, options.workers)
+    wall = perf_counter() - start
+    for result in results:
+        print(f"seed {result['seed']}: {result['ticks'] / result['seconds']:.0f} ticks/s, health {result['playerHealth']}, "
+              f"{result['enemies']} enemies, {result['objects']} objects, {result['contactBegins']} contacts")
+    summary = aggregate(results)
+    print(f"{summary['worlds']} worlds, {summary['ticks']} ticks in {wall:.2f}s: {summary['ticks'] / wall:.0f} world ticks/s, "
+          f"health {summary['playerHealth']['mean']:.0f} (min {summary['playerHealth']['min']}, max {summary['playerHealth']['max']})")
+
+    if options.output:
+        with open(options.output, "w") as file:
+            json.dump({"settings": vars(options), "worlds": results, "aggregate": summary}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Chunked World Streaming For Pygame Games"""
+import pickle
+import tempfile
+from os import remove
+from os.path import join
+
+from tiles import TileChunk
+
+
+class WorldStreamer:
+    """Parks objects outside the area around the camera and player: they are packed and taken out
+    of the game's registry, grid and enemy store so they cost nothing per tick, then unpacked and
+    spawned again once back in range.\n
+    chunkSize -> pixels along each side of a streaming chunk\n
+    radius -> chunks kept active beyond the camera and player\n
+    spillRadius -> parked chunks further than this are pickled to disk, None keeps them in memory\n
+    spillDir -> folder for spilled chunks, a temporary folder when None\n
+    interval -> steps between looking for active objects that left the area"""
+
+    def __init__(self, game, chunkSize: int, radius: int = 2, spillRadius: int = None, spillDir: str = None, interval: int = 30) -> None:
+        self.game = game
+        self.chunkSize = chunkSize
+        self.radius = radius
+        self.spillRadius = spillRadius
+        self.spillDir = spillDir
+        self.interval = interval
+        self.parked: dict[tuple[int, int], list] = {}
+        self.spilled: set[tuple[int, int]] = set()
+        # pickling drops each object's pool, they are put back on load
+        self.spilledPools: dict[tuple[int, int], list] = {}
+        self.region: tuple[int, int, int, int] = None
+        self.steps = 0
+
+    def chunkOf(self, obj) -> tuple[int, int]:
+        x, y = obj.rect.center
+        return x // self.chunkSize, y // self.chunkSize
+
+    def activeRegion(self) -> tuple[int, int, int, int]:
+        "(left, top, right, bottom) chunks, inclusive"
+        area = self.game.camera().union(self.game.player.rect)
+        size = self.chunkSize
+        return (
+            area.left // size - self.radius,
+            area.top // size - self.radius,
+            (area.right - 1) // size + self.radius,
+            (area.bottom - 1) // size + self.radius,
+        )
+
+    def distance(self, key: tuple[int, int]) -> int:
+        "Chunks between key and the active region, 0 inside it"
+        left, top, right, bottom = self.region
+        x, y = key
+        return max(left - x, x - right, top - y, y - bottom, 0)
+
+    def update(self) -> None:
+        "Call once per step"
+        self.steps += 1
+        region = self.activeRegion()
+        moved = region != self.region
+        self.region = region
+        if moved:
+            self.unparkInRange()
+        if moved or self.steps % self.interval == 0:
+            self.parkOutOfRange()
+        if moved and self.spillRadius is not None:
+            self.spillFarChunks()
+
+    def parkOutOfRange(self) -> None:
+        game = self.game
+        leaving = []
+        for obj in game.registry.objects:
+            key = self.chunkOf(obj)
+            if self.distance(key):
+                leaving.append((obj, key))
+        if not leaving:
+            return
+        for obj, _ in leaving:
+            game.registry.despawn(obj)
+        # also takes them out of the grid and enemy store
+        game.flushDespawns(recycle=False)
+        for obj, key in leaving:
+            obj.pack()
+            self.parked.setdefault(key, []).append(obj)
+
+    def unparkInRange(self) -> None:
+        game = self.game
+        for key in [key for key in self.parked if not self.distance(key)]:
+            objects = self.parked.pop(key)
+            if key in self.spilled:
+                objects += self.load(key)
+            for obj in objects:
+                # tile chunks are spawned again by their layer when a tile is placed
+                if obj in game.registry:
+                    continue
+                obj.unpack()
+                game.spawn(obj)
+
+    def spillFarChunks(self) -> None:
+        for key, objects in self.parked.items():
+            if key in self.spilled or self.distance(key) <= self.spillRadius:
+                continue
+            # tile chunks stay referenced by their layer so there is nothing to free
+            spill = [obj for obj in objects if not isinstance(obj, TileChunk)]
+            if not spill:
+                continue
+            if self.spillDir is None:
+                self.spillDir = tempfile.mkdtemp(prefix="world_")
+            with open(self.spillPath(key), "wb") as file:
+                pickle.dump(spill, file, pickle.HIGHEST_PROTOCOL)
+            self.spilledPools[key] = [obj.pool for obj in spill]
+            self.parked[key] = [obj for obj in objects if isinstance(obj, TileChunk)]
+            self.spilled.add(key)
+
+    def spillPath(self, key: tuple[int, int]) -> str:
+        return join(self.spillDir, f"{key[0]}_{key[1]}.pickle")
+
+    def load(self, key: tuple[int, int]) -> list:
+        path = self.spillPath(key)
+        with open(path, "rb") as file:
+            objects = pickle.load(file)
+        remove(path)
+        self.spilled.discard(key)
+        for obj, pool in zip(objects, self.spilledPools.pop(key)):
+            obj.pool = pool
+        return objects
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.game.registry),
+            "parked": sum(len(objects) for objects in self.parked.values()),
+            "spilledChunks": len(self.spilled),
+        }
+
+    def close(self) -> None:
+        "Deletes spilled chunks, the objects in them are lost"
+        for key in self.spilled:
+            remove(self.spillPath(key))
+            self.parked.pop(key, None)
+        self.spilled.clear()
+        self.spilledPools.clear()
@@ -0,0 +1,283 @@
+"""Static Tile Layer For Pygame Games"""
+import numpy as np
+import pygame as pg
+
+from collision import CoreObject, CorePlayer, ObjectData, collisionBounds, collideMask, collisionStats, spriteSize, transformCache
+
+
+# -----------Tile View----------- #
+
+
+class Tile:
+    "One occupied cell of a TileLayer, returned in collisions in place of the chunk holding it"
+    type = "Tile"
+    # tiles only have health
+    extraData = None
+
+    def __init__(self, chunk: "TileChunk", column: int, row: int) -> None:
+        self.chunk = chunk
+        self.column, self.row = column, row
+        self.localColumn = column - chunk.column * chunk.layer.chunkTiles
+        self.localRow = row - chunk.row * chunk.layer.chunkTiles
+        self.data = ObjectData(self)
+
+    def __repr__(self) -> str:
+        return f"Tile({self.column}, {self.row})"
+
+    @property
+    def health(self) -> int:
+        "Read from and written to the chunk's health array"
+        return self.chunk.health.item(self.localRow, self.localColumn)
+
+    @health.setter
+    def health(self, value: int) -> None:
+        self.chunk.health[self.localRow, self.localColumn] = value
+
+    @property
+    def kind(self) -> int:
+        return int(self.chunk.occupancy[self.localRow, self.localColumn])
+
+    @property
+    def rect(self) -> pg.Rect:
+        layer = self.chunk.layer
+        return layer.tileRect(self.column, self.row, self.kind)
+
+
+# -----------Tile Chunk----------- #
+
+
+class TileChunk(CoreObject):
+    """chunkTiles x chunkTiles cells of a TileLayer drawn from one baked surface and
+    collided with one combined mask, collisions report the Tiles touched"""
+    type = "Tiles"
+    collisionResponse = "static"
+    # health is per cell, see Tile
+    data = None
+
+    def __init__(self, layer: "TileLayer", column: int, row: int) -> None:
+        self.layer = layer
+        self.column, self.row = column, row
+        size = layer.chunkTiles
+        self.occupancy = np.zeros((size, size), dtype=np.int16)
+        self.health = np.zeros((size, size), dtype=np.int64)
+        self.name = None
+        self.scale, self.angle = 1, 0
+        self.area = pg.Rect(column * size * layer.tileSize, row * size * layer.tileSize, size * layer.tileSize, size * layer.tileSize)
+        self.rect = self.area.copy()
+        self.size = list(self.rect.size)
+        self.morphedImage, self.scaledImage, self.rotatedImage, self.mask = None, None, None, None
+        # (tile, rect, mask) of every occupied cell as last baked
+        self.placed: list[tuple[Tile, pg.Rect, pg.mask.Mask]] = []
+        self.placedRects: list[pg.Rect] = []
+        self.rotationTable, self.handle, self.pool = None, None, None
+        self.extraData = None
+
+    def count(self) -> int:
+        "Occupied cells"
+        return int(np.count_nonzero(self.occupancy))
+
+    def bake(self) -> None:
+        "Redraws the chunk's surface and mask from its occupied cells"
+        layer = self.layer
+        placed = []
+        rows, columns = np.nonzero(self.occupancy)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            kind = int(self.occupancy[row, column])
+            tile = layer.tile(self.column * layer.chunkTiles + column, self.row * layer.chunkTiles + row)
+            image, mask = layer.kindImage(kind)
+            placed.append((tile, image, mask, layer.tileRect(tile.column, tile.row, kind)))
+        self.placed = [(tile, rect, mask) for tile, _, mask, rect in placed]
+        self.placedRects = [rect for _, rect, _ in self.placed]
+        if not placed:
+            self.rect = self.area.copy()
+            self.rotatedImage, self.mask = None, None
+            return
+
+        self.rect = self.placedRects[0].unionall(self.placedRects)
+        x, y = self.rect.topleft
+        surface = pg.Surface(self.rect.size, pg.SRCALPHA)
+        if pg.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        surface.fill((0, 0, 0, 0))
+        surface.blits([(image, (rect.x - x, rect.y - y)) for _, image, _, rect in placed], False)
+        combined = pg.mask.Mask(self.rect.size)
+        for _, _, mask, rect in placed:
+            combined.draw(mask, (rect.x - x, rect.y - y))
+        self.rotatedImage, self.mask = surface, combined
+        self.size = list(self.rect.size)
+
+    def reload(self) -> None:
+        self.bake()
+
+    def rotate(self) -> None: ...
+
+    def pack(self):
+        self.rotatedImage, self.mask = None, None
+        self.placed, self.placedRects = [], []
+
+    def unpack(self):
+        self.bake()
+
+    def touching(self, player: CorePlayer) -> list[Tile]:
+        "Tiles whose masks overlap player"
+        touched = []
+        for index in collisionBounds(player).collidelistall(self.placedRects):
+            tile, rect, mask = self.placed[index]
+            collisionStats.maskTests += 1
+            if mask.overlap(player.mask, (player.rect.x - rect.x, player.rect.y - rect.y)):
+                touched.append(tile)
+        return touched
+
+    # same response as Object, returning the tiles touched instead of True
+    def resolveXCollision(self, player: CorePlayer) -> list[Tile]:
+        if self.mask is None or not collideMask(self, player):
+            return []
+        touched = self.touching(player)
+        player.rect.x -= player.x_vel / abs(player.x_vel)
+        return touched
+
+    def resolveYCollision(self, player: CorePlayer) -> list[Tile]:
+        if self.mask is None or not collideMask(self, player):
+            return []
+        touched = self.touching(player)
+        player.rect.y -= player.y_vel / abs(player.y_vel)
+        return touched
+
+
+# -----------Tile Layer----------- #
+
+
+class TileLayer:
+    """Grid placed static objects stored as per chunk occupancy and health arrays.\n
+    tileSize -> pixels per cell\n
+    chunkTiles -> cells along each side of a chunk, a chunk is one blit and one mask test\n
+    Changes mark their chunk, bake() then redraws only the marked chunks."""
+
+    def __init__(self, tileSize: int, chunkTiles: int = 8) -> None:
+        self.tileSize = tileSize
+        self.chunkTiles = chunkTiles
+        self.chunks: dict[tuple[int, int], TileChunk] = {}
+        # kind ids start at 1, 0 is an empty cell
+        self.kinds: list[tuple[str, int | float]] = [None]
+        self.kindImages: dict[int, tuple[pg.Surface, pg.mask.Mask, tuple[int, int]]] = {}
+        self.tiles: dict[tuple[int, int], Tile] = {}
+        self.changed: set[TileChunk] = set()
+        self.despawnQueue: list[Tile] = []
+        # bumped on every cell change, lets users such as pathfinding tell when to rebuild
+        self.version = 0
+
+    def __len__(self) -> int:
+        return sum(chunk.count() for chunk in self.chunks.values())
+
+    def addKind(self, name: str, scale: int | float = 1) -> int:
+        "Registers a sprite drawn at scale the way Object(x, y, name, scale) would be, returns its kind id"
+        self.kinds.append((name, scale))
+        return len(self.kinds) - 1
+
+    def kindId(self, name: str, scale: int | float = 1) -> int:
+        "Id of the kind drawing name at scale, added when missing"
+        if (name, scale) in self.kinds:
+            return self.kinds.index((name, scale))
+        return self.addKind(name, scale)
+
+    def kindImage(self, kind: int) -> tuple[pg.Surface, pg.mask.Mask]:
+        entry = self.kindImages.get(kind)
+        if entry is None:
+            name, scale = self.kinds[kind]
+            size = spriteSize(name)
+            image, mask = transformCache.rotated(name, size, scale, 0)
+            # centred on the unscaled sprite, matching CoreObject.reload
+            offset = image.get_rect(center=pg.Rect((0, 0), size).center).topleft
+            entry = self.kindImages[kind] = image, mask, offset
+        return entry[:2]
+
+    def tileRect(self, column: int, row: int, kind: int) -> pg.Rect:
+        image, _ = self.kindImage(kind)
+        offsetX, offsetY = self.kindImages[kind][2]
+        return pg.Rect(column * self.tileSize + offsetX, row * self.tileSize + offsetY, *image.get_size())
+
+    def chunkAt(self, column: int, row: int, create: bool = False) -> TileChunk | None:
+        key = column // self.chunkTiles, row // self.chunkTiles
+        chunk = self.chunks.get(key)
+        if chunk is None and create:
+            chunk = self.chunks[key] = TileChunk(self, *key)
+        return chunk
+
+    def cellAt(self, x: int, y: int) -> tuple[int, int]:
+        return x // self.tileSize, y // self.tileSize
+
+    def get(self, column: int, row: int) -> int:
+        "Kind at a cell, 0 when empty"
+        chunk = self.chunkAt(column, row)
+        if chunk is None:
+            return 0
+        return int(chunk.occupancy[row - chunk.row * self.chunkTiles, column - chunk.column * self.chunkTiles])
+
+    def tile(self, column: int, row: int) -> Tile:
+        "The Tile view of an occupied cell, the same object until the tile is removed"
+        tile = self.tiles.get((column, row))
+        if tile is None:
+            tile = self.tiles[column, row] = Tile(self.chunkAt(column, row), column, row)
+        return tile
+
+    def place(self, column: int, row: int, kind: int, health: int = 0) -> TileChunk:
+        "Fills a cell, returns its chunk"
+        chunk = self.chunkAt(column, row, create=True)
+        localRow, localColumn = row - chunk.row * self.chunkTiles, column - chunk.column * self.chunkTiles
+        chunk.occupancy[localRow, localColumn] = kind
+        chunk.health[localRow, localColumn] = health
+        self.changed.add(chunk)
+        self.version += 1
+        return chunk
+
+    def loadChunk(self, column: int, row: int, occupancy: np.ndarray, health: np.ndarray) -> TileChunk:
+        "Replaces a whole chunk's cells, column and row count chunks not tiles"
+        chunk = self.chunks.get((column, row))
+        if chunk is None:
+            chunk = self.chunks[column, row] = TileChunk(self, column, row)
+        chunk.occupancy[:] = occupancy
+        chunk.health[:] = health
+        for key in [key for key, tile in self.tiles.items() if tile.chunk is chunk]:
+            del self.tiles[key]
+        self.changed.add(chunk)
+        self.version += 1
+        return chunk
+
+    def remove(self, column: int, row: int) -> TileChunk | None:
+        "Empties a cell, returns its chunk"
+        chunk = self.chunkAt(column, row)
+        if chunk is None:
+            return None
+        localRow, localColumn = row - chunk.row * self.chunkTiles, column - chunk.column * self.chunkTiles
+        chunk.occupancy[localRow, localColumn] = 0
+        chunk.health[localRow, localColumn] = 0
+        self.tiles.pop((column, row), None)
+        self.changed.add(chunk)
+        self.version += 1
+        return chunk
+
+    def despawn(self, tile: Tile) -> None:
+        "Queues tile for removal at the next flush"
+        self.despawnQueue.append(tile)
+
+    def flush(self) -> None:
+        for tile in self.despawnQueue:
+            if self.tiles.get((tile.column, tile.row)) is tile:
+                self.remove(tile.column, tile.row)
+        self.despawnQueue = []
+
+    def reload(self) -> None:
+        "Marks every chunk to be redrawn from its kinds' current sprites"
+        self.kindImages.clear()
+        self.changed.update(self.chunks.values())
+
+    def bake(self) -> list[TileChunk]:
+        """Redraws chunks changed since the last bake and returns them,
+        chunks left empty are dropped from the layer"""
+        changed = list(self.changed)
+        self.changed.clear()
+        for chunk in changed:
+            chunk.bake()
+            if chunk.mask is None:
+                del self.chunks[chunk.column, chunk.row]
+        return changed